@@ -0,0 +1,9 @@
+import os
+
+from panda3d.core import get_model_path, Filename
+
+
+# the models, textures and shaders are looked up from the top directory of this repository,
+# while the directory of __main__ is this package when a benchmark is run with python -m.
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+get_model_path().prepend_directory(Filename.from_os_specific(root))
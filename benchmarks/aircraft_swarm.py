@@ -0,0 +1,64 @@
+"""Compare update time of AircraftSwarm with and without the spatial hash broadphase.
+   Run from the top directory of this repository:
+        python -m benchmarks.aircraft_swarm
+"""
+import argparse
+import time
+
+import numpy as np
+from panda3d.core import load_prc_file_data
+from panda3d.bullet import BulletWorld
+from direct.showbase.ShowBase import ShowBase
+
+from maze_land.maze3D import MazeBuilder, RenderMode, PhysicsMode
+from maze_land.aircraft import AircraftSwarm
+from maze_land.basic_character import Status
+
+
+def measure(maze, n, broadphase, frames, dt=1 / 60):
+    swarm = AircraftSwarm(maze, n=n, seed=1, broadphase=broadphase)
+    swarm.set_up()
+    # skip coming down to the maze, which is done by intervals.
+    swarm.pos[:, 2] = swarm.start_z
+    swarm.states[:] = Status.STOP.value
+    walker_pos = np.array([*maze.space_to_cartesian(*maze.entrance), swarm.start_z])
+
+    start = time.perf_counter()
+
+    for _ in range(frames):
+        swarm.update(dt)
+        swarm.detect_collisions(walker_pos, 0.3, 0.5)
+
+    elapsed = (time.perf_counter() - start) / frames
+    pairs = len(swarm.get_candidate_pairs()[0])
+
+    for root_np in swarm.roots:
+        root_np.remove_node()
+
+    return elapsed, pairs
+
+
+def main(size, counts, frames):
+    load_prc_file_data('', 'window-type none\naudio-library-name null')
+    ShowBase()
+    base.accept('finish', lambda: None)
+    world = BulletWorld()
+
+    maze = MazeBuilder(world, base.render, render_mode=RenderMode.MESH, physics_mode=PhysicsMode.COMPOUND)
+    maze.setup(size, size)
+
+    print(f"{'agents':>6} {'all pairs':>10} {'candidates':>10} {'brute(ms)':>10} {'hash(ms)':>9}")
+
+    for n in counts:
+        brute_time, all_pairs = measure(maze, n, False, frames)
+        hash_time, candidates = measure(maze, n, True, frames)
+        print(f'{n:>6} {all_pairs:>10} {candidates:>10} {brute_time * 1000:>10.3f} {hash_time * 1000:>9.3f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('counts', nargs='*', type=int, default=[2, 10, 50, 100, 200, 500])
+    parser.add_argument('--size', type=int, default=101, help='the number of rows and columns of the maze.')
+    parser.add_argument('--frames', type=int, default=300)
+    args = parser.parse_args()
+    main(args.size, args.counts, args.frames)
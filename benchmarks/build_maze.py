@@ -0,0 +1,68 @@
+"""Compare node counts and build time of MazeBuilder between the build modes.
+   Run from the top directory of this repository:
+        python -m benchmarks.build_maze
+"""
+import argparse
+import time
+
+from panda3d.core import load_prc_file_data
+from panda3d.bullet import BulletWorld
+from direct.showbase.ShowBase import ShowBase
+
+from maze_land.maze3D import MazeBuilder, RenderMode, PhysicsMode
+
+
+MODES = [
+    (RenderMode.BLOCK, PhysicsMode.BLOCK),
+    (RenderMode.MESH, PhysicsMode.BLOCK),
+    (RenderMode.MESH, PhysicsMode.COMPOUND),
+    (RenderMode.MESH, PhysicsMode.TRIANGLE_MESH),
+]
+
+
+def count(maze, world):
+    nodes = maze.np_walls.find_all_matches('**').get_num_paths()
+    geom_nodes = maze.np_walls.find_all_matches('**/+GeomNode').get_num_paths()
+    bodies = world.get_num_rigid_bodies()
+    shapes = sum(world.get_rigid_body(i).get_num_shapes() for i in range(bodies))
+    return nodes, geom_nodes, bodies, shapes
+
+
+def measure(world, size, render_mode, physics_mode):
+    maze = MazeBuilder(world, base.render, render_mode=render_mode, physics_mode=physics_mode)
+
+    start = time.perf_counter()
+    maze.setup(size, size)
+    build_time = time.perf_counter() - start
+
+    counts = count(maze, world)
+
+    start = time.perf_counter()
+    maze.destroy()
+    destroy_time = time.perf_counter() - start
+    maze.np_walls.remove_node()
+
+    return counts, build_time, destroy_time
+
+
+def main(sizes):
+    load_prc_file_data('', 'window-type none\naudio-library-name null')
+    ShowBase()
+    world = BulletWorld()
+
+    print(f"{'size':>5} {'render':>6} {'physics':>13} {'nodes':>8} {'geoms':>8} "
+          f"{'bodies':>7} {'shapes':>7} {'build(s)':>9} {'destroy(s)':>10}")
+
+    for size in sizes:
+        for render_mode, physics_mode in MODES:
+            counts, build_time, destroy_time = measure(world, size, render_mode, physics_mode)
+            print(f'{size:>5} {render_mode.name:>6} {physics_mode.name:>13} '
+                  f'{counts[0]:>8} {counts[1]:>8} {counts[2]:>7} {counts[3]:>7} '
+                  f'{build_time:>9.3f} {destroy_time:>10.3f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('sizes', nargs='*', type=int, default=[21, 101, 301])
+    args = parser.parse_args()
+    main(args.sizes)
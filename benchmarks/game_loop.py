@@ -0,0 +1,77 @@
+"""Measure the frame time of the game loop run headless with a fixed seed and time step.
+   Run from the top directory of this repository:
+        python -m benchmarks.game_loop
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from maze_land.simulation import HeadlessMazeLand
+from maze_land.profiler import profiler
+
+
+def step_frames(app, frames):
+    times = np.zeros(frames)
+
+    for i in range(frames):
+        start = time.perf_counter()
+        app.task_mgr.step()
+        times[i] = time.perf_counter() - start
+
+    return times
+
+
+def measure(frames, seed=0, warmup=60):
+    """Return the frame times of the frames, the mean time of each profiled section
+       over the same number of frames run after them, the number of finished rounds
+       and the seconds from the start to the first frame.
+    """
+    app = HeadlessMazeLand(seed=seed)
+    step_frames(app, warmup)
+    times = step_frames(app, frames)
+
+    profiler.allocate(frames + 1)
+    profiler.enable()
+    step_frames(app, frames)
+    profiler.enable(False)
+    sections = {name: mean for name, (mean, _) in profiler.get_stats(frames).items()}
+
+    return times, sections, len(app.results), app.first_frame_time
+
+
+def main(frames, seed, as_json):
+    times, sections, rounds, startup = measure(frames, seed)
+    stats = {
+        'frames': frames,
+        'rounds': rounds,
+        'startup_s': startup,
+        'mean_ms': times.mean() * 1000,
+        'median_ms': np.median(times) * 1000,
+        'p99_ms': np.percentile(times, 99) * 1000,
+        'max_ms': times.max() * 1000,
+        'sections_ms': sections,
+    }
+
+    if as_json:
+        print(json.dumps(stats))
+        return
+
+    print(f"{'frames':>6} {'rounds':>6} {'mean(ms)':>9} {'median(ms)':>10} {'p99(ms)':>8} {'max(ms)':>8}")
+    print(f"{frames:>6} {rounds:>6} {stats['mean_ms']:>9.3f} {stats['median_ms']:>10.3f} "
+          f"{stats['p99_ms']:>8.3f} {stats['max_ms']:>8.3f}")
+
+    print(f'first frame {startup:.3f} s')
+
+    for name, mean in sections.items():
+        print(f'{name:>10} {mean:>7.3f} ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--frames', type=int, default=3600)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='print the result as a JSON object.')
+    args = parser.parse_args()
+    main(args.frames, args.seed, args.json)
@@ -0,0 +1,75 @@
+"""Measure the launch time of the game without a window, loading the assets from
+   the sources (cold), the sources through the model cache of Panda3D, and the bundle
+   made by `python -m maze_land.bundle` (warm). Each launch is a new process.
+   Run from the top directory of this repository:
+        python -m benchmarks.startup
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from panda3d.core import load_prc_file_data
+
+
+MODES = ('cold', 'model_cache', 'bundle')
+
+
+def launch(mode):
+    """Start the game in this process and print the seconds taken to the first frame as JSON.
+    """
+    if mode == 'cold':
+        load_prc_file_data('', 'model-cache-dir')
+
+    from maze_land.assets import assets
+    from maze_land.simulation import HeadlessMazeLand
+
+    assets.use_bundle = mode == 'bundle'
+    app = HeadlessMazeLand(seed=0)
+    app.task_mgr.step()
+
+    print(json.dumps({
+        'first_frame_s': app.first_frame_time,
+        'preload_s': assets.preload_time,
+        'load_ms': {path: t * 1000 for path, t in assets.load_times.items()},
+    }))
+
+
+def measure(mode, repeat):
+    """Return the wall times of the launches, including starting Python and the imports,
+       and the statistics printed by them.
+    """
+    cmd = [sys.executable, '-m', 'benchmarks.startup', '--launch', mode]
+    times, stats = [], []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+        times.append(time.perf_counter() - start)
+        stats.append(json.loads(out))
+
+    return times, stats
+
+
+def main(repeat):
+    print(f"{'mode':<12} {'launch(s)':>10} {'first frame(s)':>15} {'preload(s)':>11}")
+
+    for mode in MODES:
+        times, stats = measure(mode, repeat)
+        first_frame = statistics.median(s['first_frame_s'] for s in stats)
+        preload = statistics.median(s['preload_s'] for s in stats)
+        print(f'{mode:<12} {statistics.median(times):>10.3f} {first_frame:>15.3f} {preload:>11.3f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--launch', choices=MODES, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.launch:
+        launch(args.launch)
+    else:
+        main(args.repeat)
@@ -0,0 +1,320 @@
+"""Run the benchmarks of maze generation, maze cache, maze build, physics queries, terrain collision,
+   aircrafts, the game loop and startup, and save the results as JSON, which can be compared between commits.
+   Run from the top directory of this repository:
+        python -m benchmarks.suite -o results.json
+        python -m benchmarks.suite -k create_maze -k physics
+        python -m benchmarks.suite --compare old.json new.json
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from panda3d.core import load_prc_file_data, NodePath, PandaSystem, BitMask32, Point3
+from panda3d.bullet import BulletWorld, BulletRigidBodyNode, BulletSphereShape
+
+from maze_land.maze3D import MazeBuilder, RenderMode, PhysicsMode
+from maze_land.basic_character import Direction, Sensor
+from maze_land.scene import TerrainCollision
+from maze_algorithm.cache import MazeCache
+from . import build_maze, aircraft_swarm, terrain_collision as benchmarks_terrain_collision
+from . import startup as benchmarks_startup
+
+
+BENCHMARKS = []
+
+
+def benchmark(func):
+    BENCHMARKS.append(func)
+    return func
+
+
+def result(name, params, times, number=1, **extra):
+    """Return a result of the times taken by the repeats of number calls, as the seconds per call.
+    """
+    per_call = [t / number for t in times]
+
+    return {
+        'name': name,
+        'params': params,
+        'unit': 's',
+        'repeat': len(times),
+        'number': number,
+        'min': min(per_call),
+        'median': statistics.median(per_call),
+        'mean': statistics.mean(per_call),
+        'stdev': statistics.stdev(per_call) if len(per_call) > 1 else 0.0,
+        'extra': extra,
+    }
+
+
+def repeat_calls(func, repeat, number=1):
+    times = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append(time.perf_counter() - start)
+
+    return times
+
+
+def get_implementations():
+    """Return {name: WallExtendingAlgorithm} of pymaze, and cymaze if it is built.
+    """
+    implementations = {}
+
+    for name in ['pymaze', 'cymaze']:
+        try:
+            module = importlib.import_module(f'maze_algorithm.{name}.wall_extending')
+        except ImportError:
+            continue
+        implementations[name] = module.WallExtendingAlgorithm
+
+    return implementations
+
+
+@benchmark
+def create_maze(args):
+    for name, algorithm in get_implementations().items():
+        for size in args.sizes:
+            maze = algorithm(size, size, 1)
+            number = max(1, int(0.2 / max(1e-6, min(repeat_calls(maze.create_maze, 1)))))
+            times = repeat_calls(maze.create_maze, args.repeat, number)
+            yield result('create_maze', {'impl': name, 'size': size}, times, number)
+
+
+@benchmark
+def maze_cache(args, count=100):
+    """Load the mazes from a maze cache, compared with create_maze.
+    """
+    with tempfile.TemporaryDirectory() as dir_path:
+        file_path = os.path.join(dir_path, 'levels.mzl')
+
+        for size in args.sizes:
+            MazeCache.build(file_path, size, size, range(count))
+
+        cache = MazeCache(file_path)
+
+        for size in args.sizes:
+            def _load():
+                for seed in range(count):
+                    cache.get(size, size, seed)
+
+            times = repeat_calls(_load, args.repeat)
+            yield result('maze_cache_get', {'size': size}, times, count,
+                         bytes_per_maze=(size * size + 7) // 8)
+
+        del cache
+
+
+@benchmark
+def maze_build(args):
+    world = BulletWorld()
+
+    for size in args.sizes:
+        for render_mode, physics_mode in build_maze.MODES:
+            build_times, destroy_times = [], []
+
+            for _ in range(args.repeat):
+                counts, build_time, destroy_time = build_maze.measure(world, size, render_mode, physics_mode)
+                build_times.append(build_time)
+                destroy_times.append(destroy_time)
+
+            params = {'size': size, 'render': render_mode.name, 'physics': physics_mode.name}
+            nodes, geom_nodes, bodies, shapes = counts
+            yield result('maze_build', params, build_times,
+                         nodes=nodes, geom_nodes=geom_nodes, bodies=bodies, shapes=shapes)
+            yield result('maze_destroy', params, destroy_times)
+
+
+@benchmark
+def physics_queries(args, size=51):
+    """Ray tests of the Sensors of the walker and contact tests of a sphere at every passage.
+    """
+    for physics_mode in PhysicsMode:
+        world = BulletWorld()
+        maze = MazeBuilder(world, base.render, render_mode=RenderMode.MESH, physics_mode=physics_mode)
+        maze.setup(size, size, seed=1)
+        z = maze.get_maze_pos().z + 2
+        centers = [Point3(*maze.space_to_cartesian(r, c), z) for r, c in zip(*maze.graph.get_passages())]
+
+        walker = NodePath('walker')
+        walker.reparent_to(base.render)
+        sensors = [Sensor(world, direction, -1) for direction in Direction.around()]
+
+        for sensor in sensors:
+            sensor.reparent_to(walker)
+
+        sphere = NodePath(BulletRigidBodyNode('sphere'))
+        sphere.node().add_shape(BulletSphereShape(0.5))
+        sphere.reparent_to(walker)
+
+        def _cast_rays():
+            for pos in centers:
+                walker.set_pos(pos)
+                for sensor in sensors:
+                    sensor.detect_obstacles(pos, mask=BitMask32.bit(4))
+
+        def _test_contacts():
+            for pos in centers:
+                walker.set_pos(pos)
+                world.contact_test(sphere.node())
+
+        params = {'physics': physics_mode.name, 'size': size}
+        queries = len(centers) * len(sensors)
+        yield result('sensor_ray_test', params, repeat_calls(_cast_rays, args.repeat), queries, queries=queries)
+        yield result('contact_test', params, repeat_calls(_test_contacts, args.repeat), len(centers),
+                     queries=len(centers))
+
+        walker.remove_node()
+        maze.destroy()
+        maze.np_walls.remove_node()
+
+
+@benchmark
+def terrain_collision(args):
+    """Ray tests to the terrain in the maze, over the landscape and across it, for each collision mode.
+    """
+    for collision in TerrainCollision:
+        stats = [benchmarks_terrain_collision.measure(collision, seed=i) for i in range(args.repeat)]
+        params = {'collision': collision.name}
+        memory = stats[0]['memory_bytes']
+
+        for name in ['maze', 'landscape', 'long']:
+            yield result(f'terrain_{name}_ray', params, [s[f'{name}_ray_s'] for s in stats], memory_bytes=memory)
+
+        yield result('terrain_build', params, [s['build_s'] for s in stats], memory_bytes=memory)
+
+
+@benchmark
+def aircrafts(args, size=101, frames=120):
+    world = BulletWorld()
+    maze = MazeBuilder(world, base.render, render_mode=RenderMode.MESH, physics_mode=PhysicsMode.COMPOUND)
+    maze.setup(size, size, seed=1)
+
+    for n in [2, 50, 200, 500]:
+        for broadphase in [False, True]:
+            times = [aircraft_swarm.measure(maze, n, broadphase, frames)[0] for _ in range(args.repeat)]
+            yield result('aircraft_update', {'agents': n, 'broadphase': broadphase, 'size': size}, times)
+
+    maze.destroy()
+    maze.np_walls.remove_node()
+
+
+@benchmark
+def game_loop(args):
+    """Run in another process, because HeadlessMazeLand makes its own ShowBase.
+    """
+    cmd = [sys.executable, '-m', 'benchmarks.game_loop', '--json', '--frames', str(args.frames)]
+    out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+    stats = json.loads(out)
+    times = [stats['mean_ms'] / 1000]
+
+    yield result('game_loop_frame', {'frames': args.frames}, times,
+                 rounds=stats['rounds'], median_ms=stats['median_ms'], p99_ms=stats['p99_ms'],
+                 max_ms=stats['max_ms'], sections_ms=stats['sections_ms'])
+
+
+@benchmark
+def startup(args):
+    """Launch the game in new processes, from the sources and from the bundle if it is made.
+    """
+    for mode in benchmarks_startup.MODES:
+        times, stats = benchmarks_startup.measure(mode, args.repeat)
+        first_frames = [s['first_frame_s'] for s in stats]
+        yield result('startup', {'mode': mode}, times, first_frame_s=statistics.median(first_frames))
+
+
+def get_meta():
+    def _git(*args):
+        try:
+            return subprocess.run(['git', *args], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    return {
+        'commit': _git('rev-parse', 'HEAD'),
+        'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'panda3d': PandaSystem.get_version_string(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run(args):
+    load_prc_file_data('', 'window-type none\naudio-library-name null')
+    from direct.showbase.ShowBase import ShowBase
+    ShowBase()
+    base.accept('finish', lambda: None)
+
+    results = []
+
+    for func in BENCHMARKS:
+        if args.keywords and not any(k in func.__name__ for k in args.keywords):
+            continue
+
+        for res in func(args):
+            results.append(res)
+            params = ' '.join(f'{k}={v}' for k, v in res['params'].items())
+            print(f"{res['name']:<18} {params:<45} median {res['median'] * 1000:>10.4f} ms", flush=True)
+
+    data = {'meta': get_meta(), 'results': results}
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=1)
+
+
+def get_key(res):
+    return res['name'], json.dumps(res['params'], sort_keys=True)
+
+
+def compare(old_path, new_path, threshold):
+    """Print the ratio of the median times of the same benchmarks in the two result files.
+    """
+    with open(old_path) as f:
+        old = {get_key(res): res for res in json.load(f)['results']}
+    with open(new_path) as f:
+        new = {get_key(res): res for res in json.load(f)['results']}
+
+    print(f"{'benchmark':<64} {'old(ms)':>10} {'new(ms)':>10} {'ratio':>7}")
+
+    for key in sorted(old.keys() & new.keys()):
+        ratio = new[key]['median'] / old[key]['median']
+        mark = 'slower' if ratio > 1 + threshold else 'faster' if ratio < 1 - threshold else ''
+        name = f"{key[0]} {' '.join(f'{k}={v}' for k, v in new[key]['params'].items())}"
+        print(f"{name:<64} {old[key]['median'] * 1000:>10.4f} {new[key]['median'] * 1000:>10.4f} "
+              f'{ratio:>7.2f} {mark}')
+
+    for key in sorted(old.keys() ^ new.keys()):
+        print(f"{key[0]} {key[1]}: only in {'old' if key in old else 'new'}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-o', '--output', default=None, help='the JSON file to which the results are saved.')
+    parser.add_argument('-k', dest='keywords', action='append', help='run only the benchmarks including the word.')
+    parser.add_argument('--sizes', nargs='*', type=int, default=[21, 101, 301])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--frames', type=int, default=3600, help='the frames of the game loop benchmark.')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files.')
+    parser.add_argument('--threshold', type=float, default=0.1, help='the ratio regarded as a change.')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare, args.threshold)
+    else:
+        run(args)
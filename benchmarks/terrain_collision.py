@@ -0,0 +1,125 @@
+"""Compare the memory, build time and ray test time of the terrain collision modes.
+   Run from the top directory of this repository:
+        python -m benchmarks.terrain_collision
+"""
+import argparse
+import ctypes
+import time
+
+import numpy as np
+from panda3d.core import load_prc_file_data, BitMask32, Point3
+from panda3d.bullet import BulletWorld
+from direct.showbase.ShowBase import ShowBase
+
+from maze_land.scene import Terrain, TerrainCollision
+
+
+class MallInfo2(ctypes.Structure):
+
+    _fields_ = [(name, ctypes.c_size_t) for name in (
+        'arena', 'ordblks', 'smblks', 'hblks', 'hblkhd', 'usmblks', 'fsmblks', 'uordblks', 'fordblks', 'keepcost')]
+
+
+def get_allocated():
+    """Return the bytes allocated by malloc in this process, including those of Panda3D and Bullet;
+       glibc 2.33 or later only.
+    """
+    mallinfo2 = ctypes.CDLL(None).mallinfo2
+    mallinfo2.restype = MallInfo2
+    info = mallinfo2()
+    return info.uordblks + info.hblkhd
+
+
+def cast_rays(world, starts, ends, mask=BitMask32.bit(1)):
+    """Return the time taken per ray and z of the hit positions; nan for no hit.
+    """
+    zs = np.full(len(starts), np.nan)
+
+    start = time.perf_counter()
+
+    for i, (pos_from, pos_to) in enumerate(zip(starts, ends)):
+        if (result := world.ray_test_closest(pos_from, pos_to, mask=mask)).has_hit():
+            zs[i] = result.get_hit_pos().z
+
+    return (time.perf_counter() - start) / len(starts), zs
+
+
+def make_rays(rng, n, half_width, length=None):
+    """Return the start and end points of vertical rays within half_width from the center,
+       or of rays of the length in random directions if length is given.
+    """
+    xy = rng.uniform(-half_width, half_width, (n, 2))
+
+    if length is None:
+        return [Point3(x, y, 30) for x, y in xy], [Point3(x, y, -30) for x, y in xy]
+
+    angles = rng.uniform(0, 2 * np.pi, n)
+    dxy = np.stack([np.cos(angles), np.sin(angles)], axis=1) * length
+    return [Point3(x, y, 10) for x, y in xy], [Point3(x + dx, y + dy, -20) for (x, y), (dx, dy) in zip(xy, dxy)]
+
+
+def measure(collision, n=2000, copies=20, seed=0):
+    """Return the statistics of the collision mode.
+        Args:
+            collision (TerrainCollision)
+            n (int): the number of rays of each kind.
+            copies (int): the number of times the shapes are made to measure their memory.
+    """
+    terrain = Terrain(collision)
+    world = BulletWorld()
+
+    for body in terrain.bodies:
+        world.attach(body)
+
+    rng = np.random.default_rng(seed)
+    stats = {'shapes': sum(body.get_num_shapes() for body in terrain.bodies)}
+    sampler = terrain.height_sampler
+
+    # the maze of 21 x 21 spaces is within 21 from the center.
+    for name, half_width, length in [('maze', 21, None), ('landscape', 128, None), ('long', 128, 100)]:
+        starts, ends = make_rays(rng, n, half_width, length)
+        stats[f'{name}_ray_s'], zs = cast_rays(world, starts, ends)
+
+        if length is None:
+            heights = sampler.get_heights([p.x for p in starts], [p.y for p in starts])
+            hit = ~np.isnan(zs)
+            stats[f'{name}_hits'] = int(hit.sum())
+            stats[f'{name}_max_error'] = float(np.max(np.abs(zs[hit] - heights[hit]), initial=0))
+
+    for body in terrain.bodies:
+        world.remove(body)
+
+    # more shapes are added to the terrain, which is no longer in the world.
+    allocated = get_allocated()
+    start = time.perf_counter()
+
+    for _ in range(copies):
+        terrain.add_shape_to_terrain()
+
+    stats['build_s'] = (time.perf_counter() - start) / copies
+    stats['memory_bytes'] = (get_allocated() - allocated) / copies
+    terrain.remove_node()
+
+    return stats
+
+
+def main(n):
+    load_prc_file_data('', 'window-type none\naudio-library-name null')
+    ShowBase()
+
+    print(f"{'mode':>8} {'shapes':>6} {'memory(KB)':>10} {'build(ms)':>9} {'maze ray(us)':>12} "
+          f"{'landscape ray(us)':>17} {'long ray(us)':>12} {'maze error':>10} {'landscape error':>15}")
+
+    for collision in TerrainCollision:
+        stats = measure(collision, n)
+        print(f"{collision.name:>8} {stats['shapes']:>6} {stats['memory_bytes'] / 1024:>10.1f} "
+              f"{stats['build_s'] * 1000:>9.2f} {stats['maze_ray_s'] * 1e6:>12.2f} "
+              f"{stats['landscape_ray_s'] * 1e6:>17.2f} {stats['long_ray_s'] * 1e6:>12.2f} "
+              f"{stats['maze_max_error']:>10.4f} {stats['landscape_max_error']:>15.4f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rays', type=int, default=2000, help='the number of rays of each kind.')
+    args = parser.parse_args()
+    main(args.rays)
@@ -1,6 +1,30 @@
+import argparse
+
+from panda3d.core import load_prc_file_data
+
 from maze_land.maze_land import MazeLand
+from maze_land.replay import Replay, ReplayPlayer
 
 
 if __name__ == '__main__':
-    app = MazeLand()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--record', default=None, help='save the session to the file.')
+    parser.add_argument('--replay', default=None, help='play back the session saved in the file at maximum speed.')
+    parser.add_argument('--levels', default=None, help='choose the mazes from the maze cache file.')
+    args = parser.parse_args()
+
+    session = None
+
+    if args.replay:
+        load_prc_file_data('', 'sync-video false')
+        session = ReplayPlayer(Replay.load(args.replay))
+
+    levels = None
+
+    if args.levels:
+        # imported only when used, not to delay opening the window.
+        from maze_algorithm.cache import MazeCache
+        levels = MazeCache(args.levels)
+
+    app = MazeLand(session, args.record, levels)
     app.run()
@@ -1,6 +1,8 @@
 try:
     from maze_algorithm.cymaze.wall_extending import WallExtendingAlgorithm
-    print('Use cython code.')
+    BACKEND = 'cython'
 except ImportError:
     from maze_algorithm.pymaze.wall_extending import WallExtendingAlgorithm
-    print('Use python code.')
\ No newline at end of file
+    BACKEND = 'python'
+
+from .batch import generate_many
\ No newline at end of file
@@ -0,0 +1,43 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from . import WallExtendingAlgorithm
+
+
+def create_maze(rows, cols, seed):
+    return WallExtendingAlgorithm(rows, cols, seed).create_maze()
+
+
+def generate_many(rows, cols, seeds, workers=None, chunksize=None):
+    """Return the mazes created from the seeds as a uint8 array of shape (len(seeds), rows, cols),
+       1 for walls and 0 for passages, whichever implementation creates them.
+       Each maze depends only on its own seed, so the result is the same
+       whatever the number of workers is.
+       Args:
+            rows (int): the number of rows; must be odd.
+            cols (int): the number of columns; must be odd.
+            seeds (iterable of int): a maze is created for each seed.
+            workers (int): the number of processes; os.cpu_count() if None.
+                           If 1, mazes are created in the current process.
+            chunksize (int): the number of seeds sent to a process at a time.
+    """
+    seeds = list(seeds)
+
+    if not seeds:
+        return np.empty((0, rows, cols), dtype=np.uint8)
+
+    workers = workers or os.cpu_count() or 1
+    args = ([rows] * len(seeds), [cols] * len(seeds), seeds)
+
+    if workers == 1 or len(seeds) == 1:
+        return np.stack([create_maze(*arg) for arg in zip(*args)]).astype(np.uint8)
+
+    if chunksize is None:
+        chunksize = max(1, len(seeds) // (workers * 4))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        grids = list(executor.map(create_maze, *args, chunksize=chunksize))
+
+    return np.stack(grids).astype(np.uint8)
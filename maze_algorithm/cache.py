@@ -0,0 +1,144 @@
+"""Build a library of mazes stored 1 bit per cell in a single file.
+   python -m maze_algorithm.cache levels.mzl --size 21 21 --count 1000
+"""
+import argparse
+import os
+import struct
+
+import numpy as np
+
+from .batch import generate_many
+
+
+class MazeCache:
+    """Mazes stored 1 bit per cell in a single file, looked up by (rows, cols, seed).
+       The file is a header of the magic, the version and the number of mazes,
+       followed by the index sorted by (seed, rows, cols) and the bit-packed grids.
+       The file is opened with numpy.memmap, so that only the index and the grids
+       which are looked up are read from the disk.
+        Args:
+            file_path (str): the file written by MazeCache.write.
+    """
+
+    magic = b'MZLV'
+    version = 1
+    header = struct.Struct('<4sIQ')
+    index_dtype = np.dtype([('seed', '<u8'), ('rows', '<u4'), ('cols', '<u4'), ('offset', '<u8')])
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.data = np.memmap(file_path, dtype=np.uint8, mode='r')
+        magic, version, count = self.header.unpack_from(self.data)
+
+        if magic != self.magic or version != self.version:
+            raise ValueError(f'{file_path} is not a maze cache of version {self.version}.')
+
+        end = self.header.size + count * self.index_dtype.itemsize
+        self.index = self.data[self.header.size:end].view(self.index_dtype)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return self.find(*key) >= 0
+
+    def find(self, rows, cols, seed):
+        """Return the position of the maze in the index; -1 if not found.
+        """
+        seeds = self.index['seed']
+        start = np.searchsorted(seeds, seed, side='left')
+        stop = np.searchsorted(seeds, seed, side='right')
+
+        for i in range(start, stop):
+            if self.index['rows'][i] == rows and self.index['cols'][i] == cols:
+                return i
+
+        return -1
+
+    def get(self, rows, cols, seed):
+        """Return the grid of the maze, 1 for walls and 0 for passages, as a uint8 array;
+           None if it is not in the cache.
+        """
+        if seed is None or (i := self.find(rows, cols, seed)) < 0:
+            return None
+
+        offset = int(self.index['offset'][i])
+        size = rows * cols
+        bits = self.data[offset:offset + (size + 7) // 8]
+
+        return np.unpackbits(bits, count=size).reshape(rows, cols)
+
+    def get_seeds(self, rows, cols):
+        """Return the sorted seeds of the mazes of the size.
+        """
+        found = (self.index['rows'] == rows) & (self.index['cols'] == cols)
+        return self.index['seed'][found]
+
+    def items(self):
+        for seed, rows, cols, _ in self.index.tolist():
+            yield (rows, cols, seed), self.get(rows, cols, seed)
+
+    @classmethod
+    def write(cls, file_path, grids):
+        """Write the mazes to the file; the file is replaced once everything is written.
+            Args:
+                file_path (str)
+                grids (dict): {(rows, cols, seed): grid}; the grids are 1 for walls and 0 for passages.
+        """
+        keys = sorted(grids, key=lambda key: (key[2], key[0], key[1]))
+        index = np.zeros(len(keys), dtype=cls.index_dtype)
+        offset = cls.header.size + index.nbytes
+        packed = []
+
+        for i, key in enumerate(keys):
+            rows, cols, seed = key
+            bits = np.packbits(np.asarray(grids[key]).astype(bool).ravel())
+            index[i] = (seed, rows, cols, offset)
+            offset += bits.nbytes
+            packed.append(bits)
+
+        tmp_path = f'{file_path}.tmp'
+
+        with open(tmp_path, 'wb') as f:
+            f.write(cls.header.pack(cls.magic, cls.version, len(keys)))
+            f.write(index.tobytes())
+
+            for bits in packed:
+                f.write(bits.tobytes())
+
+        os.replace(tmp_path, file_path)
+
+    @classmethod
+    def build(cls, file_path, rows, cols, seeds, workers=None):
+        """Create the mazes of the seeds and add them to the file, which is created if it does not exist.
+        """
+        grids = {}
+
+        if os.path.exists(file_path):
+            cache = cls(file_path)
+            grids.update(cache.items())
+            # close the memmap before the file is replaced.
+            del cache
+
+        seeds = [seed for seed in seeds if (rows, cols, seed) not in grids]
+
+        for seed, grid in zip(seeds, generate_many(rows, cols, seeds, workers)):
+            grids[(rows, cols, seed)] = grid
+
+        cls.write(file_path, grids)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('file_path')
+    parser.add_argument('--size', nargs=2, type=int, default=[21, 21], metavar=('ROWS', 'COLS'))
+    parser.add_argument('--count', type=int, default=1000, help='the number of mazes.')
+    parser.add_argument('--start', type=int, default=0, help='the first seed; the seeds are consecutive.')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    rows, cols = args.size
+    MazeCache.build(args.file_path, rows, cols, range(args.start, args.start + args.count), args.workers)
+
+    cache = MazeCache(args.file_path)
+    print(f'{len(cache)} mazes, {os.path.getsize(args.file_path)} bytes')
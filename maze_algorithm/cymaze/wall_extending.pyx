@@ -1,12 +1,12 @@
 # cython: language_level=3
 
-import random
+import os
 
 import numpy as np
 cimport numpy as np
 from cython cimport boundscheck, wraparound
-from cython.view cimport array as cvarray
-from libc.math cimport fmod
+from libc.stdlib cimport malloc, free
+from libc.stdint cimport uint64_t
 
 
 DEF WALL = 1
@@ -14,151 +14,212 @@ DEF PASSAGE = 0
 DEF EXTENDING = 2
 
 
+cdef inline uint64_t rotl(uint64_t x, int k) noexcept nogil:
+    return (x << k) | (x >> (64 - k))
+
+
+cdef inline uint64_t splitmix64(uint64_t *x) noexcept nogil:
+    cdef uint64_t z
+
+    x[0] += 0x9E3779B97F4A7C15ULL
+    z = x[0]
+    z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9ULL
+    z = (z ^ (z >> 27)) * 0x94D049BB133111EBULL
+    return z ^ (z >> 31)
+
+
 cdef class WallExtendingAlgorithm:
+    """Create a maze by the wall extending algorithm.
+       The grid is held as a flat uint8 array while a maze is being created,
+       and the extending wall is tracked as a stack of the cells it passes,
+       so that only those cells are updated when the wall is fixed or taken back.
+       Random numbers come from xoshiro256** held by each instance, and the
+       maze is created without the GIL, so that other threads keep running.
+       Args:
+            rows (int): the number of rows; must be odd.
+            cols (int): the number of columns; must be odd.
+            seed (int): seed for the random number generator of this instance;
+                        the same seed always creates the same maze.
+    """
 
     cdef:
         int rows, cols
+        uint64_t[4] state
 
-    def __init__(self, rows, cols):
+    def __init__(self, rows, cols, seed=None):
         self.rows = rows
         self.cols = cols
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        cdef:
+            uint64_t x
+            int i
+
+        if seed is None:
+            seed = int.from_bytes(os.urandom(8), 'little')
+
+        x = <uint64_t>(seed & 0xFFFFFFFFFFFFFFFF)
+
+        for i in range(4):
+            self.state[i] = splitmix64(&x)
+
+    cdef inline uint64_t next_random(self) noexcept nogil:
+        cdef:
+            uint64_t result = rotl(self.state[1] * 5, 7) * 9
+            uint64_t t = self.state[1] << 17
+
+        self.state[2] ^= self.state[0]
+        self.state[3] ^= self.state[1]
+        self.state[1] ^= self.state[2]
+        self.state[0] ^= self.state[3]
+        self.state[2] ^= t
+        self.state[3] = rotl(self.state[3], 45)
+
+        return result
+
+    cdef inline int randbelow(self, int n) noexcept nogil:
+        return <int>(((self.next_random() >> 32) * <uint64_t>n) >> 32)
 
     @wraparound(False)
     @boundscheck(False)
     cpdef np.ndarray create_maze(self):
         cdef:
-            int[:, ::1] grid, starts
-            int[::1] random_idx
-            list li
-            int x, y, i, r, c, length
-        
-        grid = np.zeros((self.rows, self.cols), dtype=np.intc)
-        
-        r = self.rows - 1
-        for i in range(self.cols):
-            grid[0, i] = 1
-            grid[r, i] = 1
+            np.ndarray arr
+            unsigned char[::1] grid
+            int[::1] starts
+            int *path
+            int *dead_ends
+            int i, length
+
+        arr = np.zeros(self.rows * self.cols, dtype=np.uint8)
+        grid = arr
+        length = ((self.rows - 2) // 2) * ((self.cols - 2) // 2)
+        starts = np.empty(length, dtype=np.intc)
+
+        path = <int *>malloc(self.rows * self.cols * sizeof(int))
+        dead_ends = <int *>malloc(self.rows * self.cols * sizeof(int))
+
+        if path is NULL or dead_ends is NULL:
+            free(path)
+            free(dead_ends)
+            raise MemoryError()
 
-        c = self.cols - 1
-        for i in range(self.rows):
-            grid[i, 0] = 1
-            grid[i, c] = 1
+        with nogil:
+            self.enclose(grid)
+            self.starts_pts(starts)
+            self.shuffle(starts)
 
-        r = (self.rows - 2) // 2
-        c = (self.cols - 2) // 2
-        length = r * c
+            for i in range(length):
+                if grid[starts[i]] != WALL:
+                    self.extend_wall(grid, starts[i], path, dead_ends)
 
-        starts = cvarray(shape=(length, 2), itemsize=sizeof(int), format='i')
-        li = list(range(length))
-        random.shuffle(li)
-        random_idx = np.array(li, dtype=np.intc)
-        self.starts_pts(starts, random_idx)
+        free(path)
+        free(dead_ends)
 
-        for i in range(length):
-            x = starts[i][0]
-            y = starts[i][1]
+        return arr.reshape(self.rows, self.cols).astype(np.intc)
 
-            if grid[y, x] != WALL:
-                self.extend_wall(grid, &x, &y)
+    @wraparound(False)
+    @boundscheck(False)
+    cdef void enclose(self, unsigned char[::1] grid) noexcept nogil:
+        cdef:
+            int i
+            int last_row = (self.rows - 1) * self.cols
+
+        for i in range(self.cols):
+            grid[i] = WALL
+            grid[last_row + i] = WALL
 
-        #print(grid)
-        return np.array(grid)
+        for i in range(1, self.rows - 1):
+            grid[i * self.cols] = WALL
+            grid[i * self.cols + self.cols - 1] = WALL
 
     @wraparound(False)
     @boundscheck(False)
-    cdef starts_pts(self, int[:, ::1] starts, int[::1] random_idx):
+    cdef void starts_pts(self, int[::1] starts) noexcept nogil:
+        """Set flat indices of the cells from which walls start to be extended.
+        """
         cdef:
-            int y, x, pos
+            int y, x
             int i = 0
-        
-        for y in range(1, self.rows - 1):
-            for x in range(1, self.cols - 1):
-                if fmod(y, 2) == 0.0 and fmod(x, 2) == 0:
-                    pos = random_idx[i]
-                    starts[pos][0] = x
-                    starts[pos][1] = y
-                    i += 1
+
+        for y in range(2, self.rows - 1, 2):
+            for x in range(2, self.cols - 1, 2):
+                starts[i] = y * self.cols + x
+                i += 1
+
+    @wraparound(False)
+    @boundscheck(False)
+    cdef void shuffle(self, int[::1] starts) noexcept nogil:
+        cdef:
+            int i, j, tmp
+
+        for i in range(starts.shape[0] - 1, 0, -1):
+            j = self.randbelow(i + 1)
+            tmp = starts[i]
+            starts[i] = starts[j]
+            starts[j] = tmp
 
     @wraparound(False)
     @boundscheck(False)
     cdef int extendable_directions(
-            self, int[:, ::1] grid, int[4][2] *directions, int[4] *extendables, int *x, int *y):
+            self, unsigned char[::1] grid, int[4] *offsets, int[4] *extendables, int pt) noexcept nogil:
         cdef:
-            int i, ahead_2x, ahead_2y
+            int i
             int cnt = 0
 
         for i in range(4):
-            ahead_2x = x[0] + directions[0][i][0] * 2
-            ahead_2y = y[0] + directions[0][i][1] * 2
-        
-            if grid[ahead_2y, ahead_2x] != EXTENDING:
-                extendables[0][cnt] = i
+            if grid[pt + offsets[0][i] * 2] != EXTENDING:
+                extendables[0][cnt] = offsets[0][i]
                 cnt += 1
-        
+
         return cnt
 
     @boundscheck(False)
     @wraparound(False)
-    cdef extend_wall(self, int[:, ::1] grid, int *org_x, int *org_y):
-
+    cdef void extend_wall(
+            self, unsigned char[::1] grid, int org_pt, int *path, int *dead_ends) noexcept nogil:
         cdef:
-            int x = org_x[0]
-            int y = org_y[0]
-
-            int min_x = org_x[0]
-            int max_x = org_x[0]
-            int min_y = org_y[0]
-            int max_y = org_y[0]
-
-            int[4][2] directions = [[0, 1], [0, -1], [1, 0], [-1, 0]]
+            # (0, 1), (0, -1), (1, 0), (-1, 0) as the offsets in the flat grid.
+            int[4] offsets = [self.cols, -self.cols, 1, -1]
             int[4] extendables
-            int idx, j, i, n, cnt, dx, dy
+            int pt = org_pt
+            int path_len = 0
+            int dead_len = 0
+            int i, cnt, d
 
         while True:
 
-            if grid[y, x] == PASSAGE:
-                grid[y, x] = EXTENDING
+            if grid[pt] == PASSAGE:
+                grid[pt] = EXTENDING
+                path[path_len] = pt
+                path_len += 1
 
-            elif grid[y, x] == WALL:
-                for j in range(min_y, max_y + 1):
-                    for i in range(min_x, max_x + 1):
-                        if grid[j, i] == EXTENDING:
-                            grid[j, i] = WALL
+            elif grid[pt] == WALL:
+                for i in range(path_len):
+                    grid[path[i]] = WALL
+                for i in range(dead_len):
+                    grid[dead_ends[i]] = PASSAGE
                 return
 
-            cnt = self.extendable_directions(grid, &directions, &extendables, &x, &y)
+            cnt = self.extendable_directions(grid, &offsets, &extendables, pt)
 
             if cnt == 0:
-                for j in range(min_y, max_y + 1):
-                    for i in range(min_x, max_x + 1):
-                        if grid[j, i] == EXTENDING:
-                            grid[j, i] = PASSAGE
-
-                x, y = org_x[0], org_y[0]
+                # go back to the previous cell.
+                path_len -= 1
+                dead_ends[dead_len] = path[path_len]
+                dead_len += 1
+                path_len -= 1
+                grid[path[path_len]] = PASSAGE
+                pt = path[path_len - 1]
                 continue
 
             if cnt == 1:
-                idx = extendables[cnt - 1]
+                d = extendables[0]
             else:
-                n = random.choice(range(cnt))
-                idx = extendables[n]
-            
-            dx = directions[idx][0]
-            dy = directions[idx][1]
-
-            grid[y + dy, x + dx] = EXTENDING
-            x += dx * 2
-            y += dy * 2
-
-            if max_x < x:
-                max_x = x
-
-            if min_x > x:
-                min_x = x
-
-            if max_y < y:
-                max_y = y
+                d = extendables[self.randbelow(cnt)]
 
-            if min_y > y:
-                min_y = y
-            
\ No newline at end of file
+            grid[pt + d] = EXTENDING
+            path[path_len] = pt + d
+            path_len += 1
+            pt += d * 2
@@ -3,62 +3,84 @@ import numpy as np
 
 
 class WallExtendingAlgorithm:
+    """Create a maze by the wall extending algorithm.
+       The grid is held as a flat bytearray while a maze is being created,
+       and the extending wall is tracked as a stack of the cells it passes,
+       so that only those cells are updated when the wall is fixed or taken back.
+       Args:
+            rows (int): the number of rows; must be odd.
+            cols (int): the number of columns; must be odd.
+            seed (int): seed for the random number generator of this instance;
+                        the same seed always creates the same maze.
+    """
 
     WALL = 1
     PASSAGE = 0
     EXTENDING = 2
 
-    def __init__(self, rows, cols):
+    def __init__(self, rows, cols, seed=None):
         self.rows = rows
         self.cols = cols
+        self.rng = random.Random(seed)
 
     def create_maze(self):
-        grid = np.zeros((self.rows, self.cols))
-        grid[[0, -1]] = self.WALL
-        grid[:, [0, -1]] = self.WALL
+        grid = bytearray(self.rows * self.cols)
+        self.enclose(grid)
 
         starts = [pt for pt in self.starts_pts()]
-        random.shuffle(starts)
+        self.rng.shuffle(starts)
 
-        for x, y in starts:
-            if grid[y, x] != self.WALL:
-                self.extend_wall(grid, x, y)
+        for pt in starts:
+            if grid[pt] != self.WALL:
+                self.extend_wall(grid, pt)
 
-        # print(grid)
-        return grid
+        return np.frombuffer(grid, dtype=np.uint8).reshape(self.rows, self.cols).astype(np.float64)
 
-    def starts_pts(self):
-        for y in range(1, self.rows - 1):
-            for x in range(1, self.cols - 1):
-                if y % 2 == 0 and x % 2 == 0:
-                    yield (x, y)
+    def enclose(self, grid):
+        last_row = (self.rows - 1) * self.cols
+        grid[:self.cols] = bytes([self.WALL]) * self.cols
+        grid[last_row:] = bytes([self.WALL]) * self.cols
+
+        for i in range(self.cols, last_row, self.cols):
+            grid[i] = self.WALL
+            grid[i + self.cols - 1] = self.WALL
 
-    def extendable_directions(self, grid, x, y):
-        for direction in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-            ahead_2x = x + direction[0] * 2
-            ahead_2y = y + direction[1] * 2
+    def starts_pts(self):
+        """Yield flat indices of the cells from which walls start to be extended.
+        """
+        for y in range(2, self.rows - 1, 2):
+            for x in range(2, self.cols - 1, 2):
+                yield y * self.cols + x
 
-            if grid[ahead_2y, ahead_2x] != self.EXTENDING:
-                yield direction
+    def extend_wall(self, grid, org_pt):
+        # (0, 1), (0, -1), (1, 0), (-1, 0) as the offsets in the flat grid.
+        offsets = (self.cols, -self.cols, 1, -1)
+        rand = self.rng.random
 
-    def extend_wall(self, grid, org_x, org_y):
-        x, y = org_x, org_y
+        pt = org_pt
+        path = []       # the cells of the extending wall
+        dead_ends = []  # the cells taken back from the wall; kept blocked until the wall is fixed.
 
         while True:
-
-            match grid[y, x]:
+            match grid[pt]:
                 case self.PASSAGE:
-                    grid[y, x] = self.EXTENDING
+                    grid[pt] = self.EXTENDING
+                    path.append(pt)
                 case self.WALL:
-                    grid[grid == self.EXTENDING] = self.WALL
+                    for i in path:
+                        grid[i] = self.WALL
+                    for i in dead_ends:
+                        grid[i] = self.PASSAGE
                     return
 
-            if not (directions := [d for d in self.extendable_directions(grid, x, y)]):
-                grid[grid == self.EXTENDING] = self.PASSAGE
-                x, y = org_x, org_y
+            if not (directions := [d for d in offsets if grid[pt + d * 2] != self.EXTENDING]):
+                # go back to the previous cell.
+                dead_ends.append(path.pop())
+                grid[path.pop()] = self.PASSAGE
+                pt = path[-1]
                 continue
 
-            d = random.choice(directions)
-            grid[y + d[1], x + d[0]] = self.EXTENDING
-            x += d[0] * 2
-            y += d[1] * 2
\ No newline at end of file
+            d = directions[int(rand() * len(directions))]
+            grid[pt + d] = self.EXTENDING
+            path.append(pt + d)
+            pt += d * 2
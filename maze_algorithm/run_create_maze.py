@@ -15,10 +15,15 @@ if __name__ == '__main__':
 # In [1]: from run_create_maze import main
 
 # In [2]: %timeit main()
-# 5.32 ms ± 189 μs per loop (mean ± std. dev. of 7 runs, 100 loops each)
+# 262 μs ± 6.1 μs per loop (mean ± std. dev. of 7 runs, 1,000 loops each)
 
 # pymaze
 # In [1]: from run_create_maze import main
 
 # In [2]: %timeit main()
-# 39.3 ms ± 3.08 ms per loop (mean ± std. dev. of 7 runs, 10 loops each)
\ No newline at end of file
+# 21.2 ms ± 0.61 ms per loop (mean ± std. dev. of 7 runs, 10 loops each)
+
+# larger mazes
+# rows x cols    pymaze     cymaze
+# 1001 x 1001    1.20 s     0.021 s
+# 2001 x 2001    4.76 s     0.124 s
\ No newline at end of file
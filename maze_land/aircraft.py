@@ -1,295 +1,396 @@
-import random
-
-from panda3d.bullet import BulletRigidBodyNode
-from panda3d.bullet import BulletSphereShape, BulletConvexHullShape
-from panda3d.core import NodePath
-from panda3d.core import TransformState, Vec3, BitMask32, Point3, LColor, Vec2
+import numpy as np
+from panda3d.core import NodePath, PandaNode
+from panda3d.core import Vec3, Point3, LColor
 from direct.interval.IntervalGlobal import Sequence, Func
 
 from shapes import Sphere, Cone
-from .utils import create_line_node
-from .basic_character import Status, Direction, Sensor
+from .basic_character import Status, Direction, BodyColor, FRONTS
 from .maze3D import Corners
+from .spatial_hash import SpatialHash
 
 
 class AirFrame(NodePath):
+    """An aircraft model. The aircrafts of the same color share a model,
+       whose body and wings are flattened into one GeomNode.
+    """
+
+    models = {}
+
+    def __init__(self, body_color):
+        super().__init__(PandaNode(body_color.name.lower()))
 
-    def __init__(self, body_color, mask):
-        super().__init__(BulletRigidBodyNode(body_color.name.lower()))
-        self.set_collide_mask(BitMask32.bit(5))
-        self.node().set_kinematic(True)
-        self.node().set_ccd_motion_threshold(1e-7)
-        self.node().set_ccd_swept_sphere_radius(0.5)
+        if body_color not in self.models:
+            self.models[body_color] = self.create_model(body_color.value)
 
-        self.create_body(body_color.value)
-        self.create_wings()
+        self.models[body_color].copy_to(self)
+
+    def create_model(self, body_color):
+        model = NodePath('airframe')
 
-    def create_body(self, body_color):
         body = Sphere(radius=0.5).create()
         # body.set_scale(Vec3(1))  # if oval, set Vec3(1, 1.5, 1).
         body.set_color(body_color)
-        body.reparent_to(self)
-
-        end, tip = body.get_tight_bounds()
-        shape = BulletSphereShape((tip - end).z / 2)
-        self.node().add_shape(shape, TransformState.make_pos(Point3(0, 0, 0)))
+        body.reparent_to(model)
 
-    def create_wings(self):
         wing = Cone(height=0.2, segs_c=3, bottom_radius=0.7).create()
-        pos = Vec3(0, -0.1, 0)
-        hpr = Vec3(-150, 0, 0)
-        wing.set_pos_hpr(pos, hpr)  # if oval: set pos to Vec3(0, -0.5, 0).
+        wing.set_pos_hpr(Vec3(0, -0.1, 0), Vec3(-150, 0, 0))  # if oval: set pos to Vec3(0, -0.5, 0).
         wing.set_color(LColor(.5, .5, .5, 1))
-        wing.reparent_to(self)
-
-        shape = BulletConvexHullShape()
-        shape.add_geom(wing.node().get_geom(0))
-        self.node().add_shape(shape, TransformState.make_pos_hpr(pos, hpr))
-
-
-class Aircraft:
-
-    def __init__(self, world, maze_builder, body_color, bit,
-                 linear_velocity=5, angular_velocity=100):
-        self.world = world
+        wing.reparent_to(model)
+
+        model.flatten_strong()
+        return model
+
+
+class AircraftSwarm:
+    """Aircrafts flying in the maze, all of which are updated in one batched step.
+       The positions, headings, states and progress of the aircrafts are held in numpy arrays,
+       and the transforms are pushed to the NodePaths once per update.
+       The routes are looked up in the graph of the maze, and the collisions are tested
+       on the arrays, so that the bodies are not attached to the Bullet world.
+       Only the aircrafts in the same or neighboring spaces are tested, found by the spatial hash.
+        Args:
+            maze_builder (MazeBuilder)
+            n (int): the number of aircrafts.
+            radius (float): the radius of an aircraft for collision tests.
+            pursuit (float): the probability of choosing the route to the walker at a junction;
+                             the other routes are chosen at random.
+            seed (int): seed for choosing the routes and the start spaces.
+            broadphase (bool): if False, every pair of aircrafts is tested;
+                               if None, the spatial hash is used only for more aircrafts than min_broadphase.
+    """
+
+    # Status: (the sign of the change of heading, the angle to turn)
+    turns = {
+        Status.LEFT_TURN: (1, 90),
+        Status.RIGHT_TURN: (-1, 90),
+        Status.U_TURN: (1, 180),
+    }
+
+    # Direction: (Status, quarters to turn)
+    movements = {
+        Direction.FORWARD: (Status.MOVE, 0),
+        Direction.LEFTWARD: (Status.LEFT_TURN, 1),
+        Direction.RIGHTWARD: (Status.RIGHT_TURN, 3),
+        Direction.BACKWARD: (Status.U_TURN, 2),
+    }
+
+    min_broadphase = 64
+
+    changing_states = [
+        status.value for status in [Status.MOVE, Status.LIFT_UP, Status.LIFT_DOWN, *turns]
+    ]
+
+    def __init__(self, maze_builder, n=2, linear_velocity=5, angular_velocity=100,
+                 radius=0.7, pursuit=0, seed=None, broadphase=None):
         self.maze = maze_builder
-        self.mask = BitMask32.bit(bit)
-
-        self.root_np = NodePath('root')
-        self.direction_np = NodePath('direction')
-        self.body = AirFrame(body_color, self.mask)
-        self.body.reparent_to(self.direction_np)
-        self.direction_np.reparent_to(self.root_np)
-        self.root_np.reparent_to(base.render)
-        self.world.attach(self.body.node())
-
+        self.n = n
         self.linear_velocity = linear_velocity
         self.angular_velocity = angular_velocity
         self.vertical_velocity = 3
+        self.radius = radius
+        self.pursuit = pursuit
+        self.rng = np.random.default_rng(seed)
+        # for a few aircrafts, testing every pair is faster than building the spatial hash.
+        self.broadphase = n > self.min_broadphase if broadphase is None else broadphase
+
+        self.roots = []
+        self.directions = []
+        self.bodies = []
+        colors = list(BodyColor)
+
+        for i in range(n):
+            root_np = NodePath(f'aircraft_{i}')
+            direction_np = NodePath('direction')
+            body = AirFrame(colors[i % len(colors)])
+            body.reparent_to(direction_np)
+            direction_np.reparent_to(root_np)
+            root_np.reparent_to(base.render)
+
+            self.roots.append(root_np)
+            self.directions.append(direction_np)
+            self.bodies.append(body)
 
-        self.sensors = [sensor for sensor in self.create_sensors()]
         self.initialize()
-        # self.draw_debug_lines()
-
-        self.body_color = body_color
 
     def initialize(self):
-        self.total_distance = 0
-        self.total_angle = 0
-        self.total_ascent = 0
+        self.pos = np.zeros((self.n, 3))
+        self.headings = np.zeros(self.n)
+        self.start_headings = np.zeros(self.n)   # the headings before turning
+        self.origins = np.zeros((self.n, 2))      # xy from which the current move started
+        self.states = np.zeros(self.n, dtype=np.int64)   # the value of Status; 0 for None.
 
-        self.dead_end = False
-        self.stop = False
-        self.state = None
+        self.total_distances = np.zeros(self.n)
+        self.total_angles = np.zeros(self.n)
+        self.total_ascents = np.zeros(self.n)
 
-    def set_up(self, corner):
-        self.start_z = self.maze.wall_size.z - 0.5 + self.maze.get_maze_pos().z
+        self.dead_ends = np.zeros(self.n, dtype=bool)
+        self.stop = np.zeros(self.n, dtype=bool)
+        self.closed = [set() for _ in range(self.n)]
+
+    def clear_states(self):
+        self.states[:] = 0
 
+    def get_corner_start(self, corner):
+        """Return the start space and heading at the corner.
+        """
         match corner:
 
             case Corners.TOP_RIGHT:
-                start_xy = self.maze.top_right - self.maze.wall_size.xy
-                hpr = Vec3(180, 0, 0)
+                return (1, self.maze.cols - 2), 180
 
             case Corners.BOTTOM_LEFT:
-                start_xy = self.maze.bottom_left + self.maze.wall_size.xy
-                hpr = Vec3(0, 0, 0)
+                return (self.maze.rows - 2, 1), 0
 
             case Corners.TOP_LEFT:
-                diff = Vec2(self.maze.wall_size.x, 0)
-                start_xy = self.maze.top_left + diff
-                hpr = Vec3(180, 0, 0)
+                return (0, 1), 180
 
             case Corners.BOTTOM_RIGHT:
-                diff = Vec2(self.maze.wall_size.x, 0)
-                start_xy = self.maze.bottom_right - diff
-                hpr = Vec3(0, 0, 0)
-
-        pos = Point3(start_xy, self.start_z + 1)
-        self.root_np.set_pos(pos)
-        self.direction_np.set_hpr(hpr)
-
-    def get_backward_pos(self, distance):
-        """Return backward position.
-           Args:
-               distance(float): must be positive.
-        """
-        backward_vector = self.direction_np.get_quat(base.render).get_forward() * -1
-        return self.root_np.get_pos() + backward_vector * distance
-
-    def create_sensors(self):
-        for direction in Direction.around():
-            if direction != Direction.BACKWARD:
-                sensor = Sensor(self.world, direction)
-                sensor.reparent_to(self.direction_np)
-                yield sensor
+                return (self.maze.rows - 1, self.maze.cols - 2), 0
 
-    def draw_debug_lines(self):
-        color = LColor(0, 0, 1, 1)
-
-        for sensor in self.sensors:
-            line = create_line_node(
-                pos := self.direction_np.get_pos(self.root_np),
-                pos + sensor.get_pos(self.root_np),
-                color
-            )
-            line.reparent_to(self.direction_np)
+    def get_random_start(self, passages):
+        """Return a random passage space and a heading to an open space next to it.
+        """
+        rows, cols = passages
+        i = self.rng.integers(len(rows))
+        row, col = int(rows[i]), int(cols[i])
 
-    def detect_route(self):
-        pos_from = self.root_np.get_pos()
-        mask = BitMask32.bit(2) | self.mask
+        for quarter, (dr, dc) in enumerate(FRONTS):
+            if self.maze.graph.is_open(row + dr, col + dc):
+                return (row, col), quarter * 90
 
-        for sensor in self.sensors:
-            if not sensor.detect_obstacles(pos_from, mask=mask):
-                yield sensor.direction
+        return (row, col), 0
 
-    def turn(self, direction, dt, max_angle=90):
-        rotate_direction = direction.get_direction()
-        angle = self.angular_velocity * dt
+    def set_up(self, corners=(Corners.TOP_RIGHT, Corners.BOTTOM_LEFT)):
+        """Put the aircrafts above the start spaces; at the corners first, and then at random.
+        """
+        self.start_z = self.maze.wall_size.z - 0.5 + self.maze.get_maze_pos().z
+        passages = self.maze.graph.get_passages()
+        self.spatial_hash = SpatialHash(self.maze.rows, self.maze.cols)
 
-        if (total := self.total_angle + angle) >= max_angle:
-            diff = max_angle - self.total_angle
-            self.direction_np.set_h(self.direction_np.get_h() - diff * rotate_direction)
-            self.total_angle = 0
-            return True
+        for i in range(self.n):
+            if i < len(corners):
+                space, heading = self.get_corner_start(corners[i])
+            else:
+                space, heading = self.get_random_start(passages)
 
-        self.total_angle = total
-        self.direction_np.set_h(self.direction_np.get_h() - angle * rotate_direction)
+            self.pos[i] = (*self.maze.space_to_cartesian(*space), self.start_z + 1)
+            self.headings[i] = heading
 
-    def move_forward(self, dt, max_distance=2):
-        forward_vector = self.direction_np.get_quat(base.render).get_forward()
-        distance = self.linear_velocity * dt
-        self.total_distance += distance
+        self.origins[:] = self.pos[:, :2]
+        self.push_transforms(np.arange(self.n))
 
-        if (diff := self.total_distance - max_distance) >= 0:
-            self.root_np.set_pos(self.root_np.get_pos() + forward_vector * (distance - diff))
-            self.total_distance = 0
-            return True
+    def start(self, durations):
+        """Let the aircrafts come down to the maze and start flying.
+            Args:
+                durations (list of float): the time for each aircraft to come down.
+        """
+        def _start(i):
+            self.pos[i, 2] = self.start_z
+            self.states[i] = Status.STOP.value
+
+        for i, duration in enumerate(durations):
+            Sequence(
+                self.roots[i].posInterval(duration, Point3(*self.pos[i, :2], self.start_z)),
+                Func(_start, i)
+            ).start()
+
+    def to_spaces(self, x, y):
+        rows = self.maze.rows // 2 - np.rint(np.divide(y, self.maze.wall_size.y)).astype(np.int64)
+        cols = self.maze.cols // 2 + np.rint(np.divide(x, self.maze.wall_size.x)).astype(np.int64)
+        return rows, cols
+
+    def get_spaces(self, indices):
+        """Return the rows and columns of the spaces where the aircrafts are.
+        """
+        return self.to_spaces(self.pos[indices, 0], self.pos[indices, 1])
 
-        self.root_np.set_pos(self.root_np.get_pos() + forward_vector * distance)
+    def update_spatial_hash(self):
+        if self.broadphase:
+            flying = np.flatnonzero(self.states != 0)
+            self.spatial_hash.update(*self.get_spaces(flying), flying)
 
-    def check_downward(self, n=5):
-        current_pos = self.root_np.get_pos()
-        below_pos = current_pos - Vec3(0, 0, 2)
+    def get_candidates(self, x, y):
+        """Return the indices of the aircrafts which can collide with something at (x, y).
+        """
+        if not self.broadphase:
+            return np.arange(self.n)
 
-        ts_from = TransformState.make_pos(below_pos)
-        ts_to = TransformState.make_pos(current_pos)
-        shape = BulletSphereShape(0.5)
+        return self.spatial_hash.get_neighbors(*self.to_spaces(x, y))
 
-        if (result := self.world.sweep_test_closest(
-                shape, ts_from, ts_to, BitMask32.bit(n), 0.0)).has_hit():
-            if result.get_node() != self.body.node():
-                return True
+    def get_candidate_pairs(self):
+        """Return two arrays of the indices of the aircrafts which can collide with each other.
+        """
+        if not self.broadphase:
+            return np.triu_indices(self.n, 1)
 
-    def lift(self, dt, max_ascent=1, direction=1):
-        distance = self.vertical_velocity * 2 * dt
+        firsts, seconds = self.spatial_hash.get_pairs()
+        return np.minimum(firsts, seconds), np.maximum(firsts, seconds)
 
-        if (total := self.total_ascent + distance) >= max_ascent:
-            z = -8.5 + max_ascent if direction > 0 else -8.5
-            self.root_np.set_z(z)
-            self.total_ascent = 0
-            return True
+    def start_movement(self, i, direction):
+        status, _ = self.movements[direction]
+        self.start_headings[i] = self.headings[i]
+        return status.value
 
-        self.root_np.set_z(self.root_np.get_z() + distance * direction)
-        self.total_ascent = total
+    def change_direction(self, i, row, col):
+        quarter = round(self.headings[i] / 90) % 4
+        directions = []
 
-    def detect_collision(self, other):
-        if (result := self.world.contact_test_pair(
-                self.body.node(), other.node())).get_num_contacts() > 0:
-            return result
+        for direction in [Direction.FORWARD, Direction.LEFTWARD, Direction.RIGHTWARD]:
+            dr, dc = FRONTS[(quarter + self.movements[direction][1]) % 4]
+            space = (row + dr, col + dc)
 
-    def get_relative_pos(self, pos):
-        return self.root_np.get_relative_point(self.direction_np, pos)
+            if self.maze.graph.is_open(*space) and space not in self.closed[i]:
+                directions.append((direction, space))
 
-    def close_route(self):
-        backward_pos = self.get_backward_pos(self.maze.wall_size.y)
-        z = self.start_z - self.maze.get_maze_pos().z
-        pos = Point3(backward_pos.xy, z)
-        scale = Vec3(self.maze.wall_size.xy, 1)
+        if not directions:
+            self.dead_ends[i] = True
+            return self.start_movement(i, Direction.BACKWARD)
 
-        _ = self.maze.make_block('closed', pos, scale, self.mask, True)
+        if len(directions) >= 2:
+            if self.dead_ends[i]:
+                # close the route behind, which leads only to dead ends.
+                dr, dc = FRONTS[(quarter + 2) % 4]
+                self.closed[i].add((row + dr, col + dc))
+                self.dead_ends[i] = False
 
-    def change_to_movement(self, direction):
-        match direction:
+            if self.rng.random() < self.pursuit:
+                directions.sort(key=lambda d: self.maze.graph.distance('walker', *d[1]))
+            else:
+                directions = [directions[self.rng.integers(len(directions))]]
 
-            case Direction.FORWARD:
-                return Status.MOVE
+        return self.start_movement(i, directions[0][0])
 
-            case Direction.LEFTWARD:
-                return Status.LEFT_TURN
-
-            case Direction.RIGHTWARD:
-                return Status.RIGHT_TURN
+    def move_forward(self, moving, dt, max_distance=2):
+        self.total_distances[moving] += self.linear_velocity * dt
+        arrived = moving & (self.total_distances >= max_distance)
+        self.total_distances[arrived] = max_distance
 
-            case Direction.BACKWARD:
-                return Status.U_TURN
+        radians = np.radians(self.headings[moving])
+        forward = np.stack([-np.sin(radians), np.cos(radians)], axis=1)
+        self.pos[moving, :2] = self.origins[moving] + forward * self.total_distances[moving, None]
 
-    def change_direction(self):
-        if not (directions := [d for d in self.detect_route()]):
-            self.dead_end = True
-            return self.change_to_movement(Direction.BACKWARD)
+        self.total_distances[arrived] = 0
+        self.origins[arrived] = self.pos[arrived, :2]
+        self.states[arrived] = self.get_next_movements(arrived)
 
-        if len(directions) >= 2:
-            if self.dead_end:
-                self.close_route()
-                self.dead_end = False
-            random.shuffle(directions)
+    def get_next_movements(self, arrived):
+        y = self.pos[arrived, 1]
+        upper = self.maze.top_left.y + self.maze.wall_size.y / 2
+        lower = self.maze.bottom_right.y - self.maze.wall_size.y / 2
 
-        return self.change_to_movement(directions[0])
+        states = np.where(self.pos[arrived, 2] > self.start_z, Status.CHECK_DOWNWARD.value, Status.STOP.value)
 
-    def get_next_movement(self):
-        if self.maze.is_outside(self.root_np.get_pos().xy):
+        if (outside := (y < lower) | (y > upper)).any():
+            states[outside] = Status.FINISH.value
             base.messenger.send('finish')
-            return Status.FINISH
 
-        elif self.root_np.get_z() > self.start_z:
-            return Status.CHECK_DOWNWARD
+        return states
 
-        return Status.STOP
+    def turn(self, active, dt):
+        for status, (sign, max_angle) in self.turns.items():
+            if not (turning := active & (self.states == status.value)).any():
+                continue
 
-    def update(self, dt):
-        if not self.stop:
-            match self.state:
+            self.total_angles[turning] += self.angular_velocity * dt
+            turned = turning & (self.total_angles >= max_angle)
+            self.total_angles[turned] = max_angle
+            self.headings[turning] = self.start_headings[turning] + sign * self.total_angles[turning]
+
+            self.headings[turned] %= 360
+            self.total_angles[turned] = 0
+            self.states[turned] = Status.MOVE.value
 
-                case Status.STOP:
-                    self.state = self.change_direction()
+    def lift(self, active, dt, max_ascent=1):
+        for status, direction, next_status in [(Status.LIFT_UP, 1, Status.MOVE), (Status.LIFT_DOWN, -1, Status.STOP)]:
+            if not (lifting := active & (self.states == status.value)).any():
+                continue
 
-                case Status.MOVE:
-                    if self.move_forward(dt):
-                        self.state = self.get_next_movement()
+            self.total_ascents[lifting] += self.vertical_velocity * 2 * dt
+            lifted = lifting & (self.total_ascents >= max_ascent)
+            self.total_ascents[lifted] = max_ascent
 
-                case Status.LEFT_TURN:
-                    if self.turn(Direction.LEFTWARD, dt):
-                        self.state = Status.MOVE
+            bottom = self.start_z if direction > 0 else self.start_z + max_ascent
+            self.pos[lifting, 2] = bottom + self.total_ascents[lifting] * direction
 
-                case Status.RIGHT_TURN:
-                    if self.turn(Direction.RIGHTWARD, dt):
-                        self.state = Status.MOVE
+            self.total_ascents[lifted] = 0
+            self.states[lifted] = next_status.value
 
-                case Status.U_TURN:
-                    if self.turn(Direction.LEFTWARD, dt, 180):
-                        self.state = Status.MOVE
+    def check_downward(self, checking):
+        """Let the aircrafts above others come down if nothing is below them.
+        """
+        for i in np.flatnonzero(checking):
+            candidates = self.get_candidates(*self.pos[i, :2])
+            pos = self.pos[candidates]
+            distances = np.linalg.norm(pos[:, :2] - self.pos[i, :2], axis=1)
+            below = (distances < self.radius * 2) & (pos[:, 2] < self.pos[i, 2]) & (self.states[candidates] != 0)
+
+            if not below.any():
+                self.states[i] = Status.LIFT_DOWN.value
+
+    def avoid_collisions(self, active):
+        """Let one of two colliding aircrafts, which is moving, fly over the other.
+        """
+        flying = active & (self.pos[:, 2] <= self.start_z)
+
+        if flying.sum() < 2:
+            return
+
+        firsts, seconds = self.get_candidate_pairs()
+        pairs = flying[firsts] & flying[seconds]
+        firsts, seconds = firsts[pairs], seconds[pairs]
+
+        squared = ((self.pos[firsts] - self.pos[seconds]) ** 2).sum(axis=1)
+        colliding = squared < (self.radius * 2) ** 2
+        firsts, seconds = firsts[colliding], seconds[colliding]
+        # in the order of the indices, so that the result does not depend on the broadphase.
+        order = np.lexsort((seconds, firsts))
+
+        for a, b in zip(firsts[order].tolist(), seconds[order].tolist()):
+            for i in (a, b):
+                if self.states[i] == Status.MOVE.value and self.pos[i, 2] <= self.start_z:
+                    self.states[i] = Status.LIFT_UP.value
+                    break
+
+    def detect_collisions(self, pos, radius, half_height=0):
+        """Return a boolean array of the aircrafts colliding with the vertical capsule.
+            Args:
+                pos (Point3): the center of the capsule.
+                radius (float): the radius of the capsule.
+                half_height (float): the half of the length of the segment of the capsule.
+        """
+        candidates = self.get_candidates(pos[0], pos[1])
+        diff = self.pos[candidates] - np.array(pos)
+        diff[:, 2] -= np.clip(diff[:, 2], -half_height, half_height)
+
+        hit = np.zeros(self.n, dtype=bool)
+        hit[candidates] = np.linalg.norm(diff, axis=1) < self.radius + radius
+        return hit & (self.states != 0)
+
+    def push_transforms(self, indices):
+        for i, (x, y, z), h in zip(indices.tolist(), self.pos[indices].tolist(), self.headings[indices].tolist()):
+            self.roots[i].set_pos(x, y, z)
+            self.directions[i].set_h(h)
+
+    def update(self, dt):
+        active = (self.states != 0) & ~self.stop
+        # the aircrafts whose transforms change in this update.
+        changing = active & np.isin(self.states, self.changing_states)
 
-                case Status.LIFT_UP:
-                    if self.lift(dt):
-                        self.state = Status.MOVE
+        if (moving := active & (self.states == Status.MOVE.value)).any():
+            self.move_forward(moving, dt)
 
-                case Status.LIFT_DOWN:
-                    if self.lift(dt, direction=-1):
-                        self.state = Status.STOP
+        self.turn(active, dt)
+        self.lift(active, dt)
+        self.update_spatial_hash()
 
-                case Status.CHECK_DOWNWARD:
-                    if not self.check_downward():
-                        self.state = Status.LIFT_DOWN
+        if (checking := active & (self.states == Status.CHECK_DOWNWARD.value)).any():
+            self.check_downward(checking)
 
-    def start(self, duration):
-        xy = self.root_np.get_pos().xy
-        pos = Point3(xy, self.start_z)
+        if len(stopped := np.flatnonzero(active & (self.states == Status.STOP.value))):
+            rows, cols = self.get_spaces(stopped)
 
-        def _start():
-            self.state = Status.STOP
+            for i, row, col in zip(stopped.tolist(), rows.tolist(), cols.tolist()):
+                self.states[i] = self.change_direction(i, row, col)
 
-        Sequence(
-            self.root_np.posInterval(duration, pos),
-            Func(_start)
-        ).start()
\ No newline at end of file
+        self.avoid_collisions(active)
+        self.push_transforms(np.flatnonzero(changing))
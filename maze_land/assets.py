@@ -0,0 +1,132 @@
+import time
+
+from panda3d.core import TexturePool, ModelPool, FontPool, NodePath, Loader, PythonTask
+
+from .profiler import profiler
+from .bundle import AssetBundle
+
+
+class AssetCache:
+    """Textures, models and fonts loaded once and shared by their file paths.
+       preload() queues all the files of the game on the thread of the Panda3D loader, which loads them
+       one by one while the window opens and the scene is made; a get method waits only for the file asked for.
+       A file not preloaded is loaded when first asked for, and kept as well.
+       The files converted by `python -m maze_land.bundle` are loaded instead of the sources if up to date.
+        Args:
+            use_bundle (bool): False to load the sources even if they are bundled.
+    """
+
+    textures = (
+        'textures/brick.jpg',
+        'textures/concrete2.jpg',
+        'textures/finish.png',
+        'textures/grass.jpg',
+        'textures/grass_01.png',
+        'textures/grass_02.jpg',
+        'textures/grass_03.jpg',
+    )
+    models = (
+        'models/blue-sky/blue-sky-sphere',
+        'models/snowman/snowman',
+    )
+    fonts = (
+        'font/Candaral.ttf',
+    )
+
+    def __init__(self, use_bundle=True):
+        self.use_bundle = use_bundle
+        self.bundle = None
+        self.assets = {}
+        self.futures = {}
+        self.results = {}   # path: the asset or the exception raised by loading it in the loader thread
+        self.load_times = {}
+        self.preload_start = None
+        self.preload_time = None
+
+    def preload(self):
+        if self.preload_start is not None:
+            return
+
+        self.preload_start = time.perf_counter()
+
+        if self.use_bundle:
+            self.bundle = AssetBundle()
+
+        loads = [
+            *((path, TexturePool.load_texture) for path in self.textures),
+            *((path, ModelPool.load_model) for path in self.models),
+            *((path, FontPool.load_font) for path in self.fonts),
+        ]
+
+        # one at a time on the single thread of the loader (loader-num-threads 1);
+        # loading the egg and image files in parallel threads corrupts the heap.
+        loader = Loader.get_global_ptr()
+
+        for path, load_func in loads:
+            if path not in self.assets:
+                task = PythonTask(self.load_in_task, f'load {path}')
+                task.set_args((path, load_func), True)
+                task.set_task_chain(loader.get_task_chain())
+                loader.get_task_manager().add(task)
+                self.futures[path] = task
+
+    def load_in_task(self, path, load_func, task):
+        try:
+            self.results[path] = self.load(path, load_func)
+        except Exception as e:
+            self.results[path] = e
+
+        return task.done
+
+    def load(self, path, load_func):
+        start = time.perf_counter()
+
+        with profiler.span(f'load {path}'):
+            bundled = self.bundle.get_path(path) if self.bundle is not None else None
+
+            if (asset := load_func(path if bundled is None else bundled)) is None:
+                raise IOError(f'Could not load {path}.')
+
+        now = time.perf_counter()
+        self.load_times[path] = now - start
+
+        if self.preload_start is not None:
+            self.preload_time = max(self.preload_time or 0, now - self.preload_start)
+
+        return asset
+
+    def get(self, path, load_func):
+        if (asset := self.assets.get(path)) is None:
+            if (future := self.futures.pop(path, None)) is not None:
+                future.wait()
+
+                if isinstance(asset := self.results.pop(path), Exception):
+                    raise asset
+            else:
+                asset = self.load(path, load_func)
+
+            self.assets[path] = asset
+
+        return asset
+
+    def get_texture(self, path):
+        return self.get(path, TexturePool.load_texture)
+
+    def get_model(self, path):
+        """Return a copy of the model, which can be changed without changing the others.
+        """
+        return NodePath(self.get(path, ModelPool.load_model).copy_subgraph())
+
+    def get_font(self, path):
+        return self.get(path, FontPool.load_font)
+
+    def is_preloaded(self):
+        return all(future.done() for future in self.futures.values())
+
+    def wait(self):
+        for path in list(self.futures):
+            self.get(path, None)
+
+
+# the assets shared by the modules of the game.
+assets = AssetCache()
@@ -4,6 +4,11 @@ from panda3d.core import NodePath, PandaNode
 from panda3d.core import BitMask32, Vec3, Point3, LColor
 
 
+# (row offset, col offset) of the space which the forward vector of a node points to,
+# for each quarter of its heading; 0, 90, 180 and 270 degrees.
+FRONTS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+
+
 class BodyColor(Enum):
 
     BLUE = LColor(0, 0, 1, 1)
@@ -0,0 +1,169 @@
+"""Convert the models to .bam and the textures to .txo with their mipmaps,
+   which are loaded at startup without parsing the egg files or decoding the images.
+   Run from the top directory of this repository after changing the assets:
+        python -m maze_land.bundle
+        python -m maze_land.bundle --compress
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+
+from panda3d.core import BamFile, BamWriter, Filename, ModelPool, TexturePool, Texture, PandaSystem, NodePath
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class AssetBundle:
+    """Pre-converted files of the assets, and manifest.json which has the content hashes of their sources.
+       A bundled file is used only while the hashes of its sources, the egg file and its textures
+       for a model, match, and the bundle was made by the same version of Panda3D.
+        Args:
+            root (str): the directory to which the asset paths are relative.
+            dir_name (str): the directory of the bundle under the root.
+    """
+
+    version = 1
+    model_patterns = ('models/**/*.egg',)
+    texture_patterns = ('textures/*.jpg', 'textures/*.png')
+
+    def __init__(self, root=ROOT, dir_name='bundle'):
+        self.root = root
+        self.dir = os.path.join(root, dir_name)
+        self.manifest_path = os.path.join(self.dir, 'manifest.json')
+        self.manifest = self.read_manifest()
+
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+        if manifest.get('version') != self.version or manifest.get('panda3d') != PandaSystem.get_version_string():
+            return {}
+
+        return manifest['assets']
+
+    @staticmethod
+    def hash_file(file_path):
+        with open(file_path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def get_source(self, path):
+        file_path = os.path.join(self.root, path)
+        stat = os.stat(file_path)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': self.hash_file(file_path)}
+
+    def is_fresh(self, entry):
+        for path, source in entry['sources'].items():
+            try:
+                stat = os.stat(os.path.join(self.root, path))
+            except OSError:
+                return False
+
+            # a file of the same size and mtime is regarded as unchanged without being hashed.
+            if stat.st_size == source['size'] and stat.st_mtime_ns == source['mtime_ns']:
+                continue
+
+            if self.hash_file(os.path.join(self.root, path)) != source['sha256']:
+                return False
+
+        return True
+
+    def get_path(self, path):
+        """Return the bundled file of the asset as Filename; None if it is not bundled or out of date.
+        """
+        if (entry := self.manifest.get(path)) is None or not self.is_fresh(entry):
+            return None
+
+        return Filename.from_os_specific(os.path.join(self.dir, entry['bundle']))
+
+    def find_assets(self, patterns):
+        for pattern in patterns:
+            for file_path in sorted(glob.glob(os.path.join(self.root, pattern), recursive=True)):
+                yield os.path.relpath(file_path, self.root).replace(os.sep, '/')
+
+    def convert_model(self, path, bundle_path):
+        """Write the model as bam with the images of its textures, and return the paths of its sources.
+        """
+        model = ModelPool.load_model(Filename.from_os_specific(os.path.join(self.root, path)))
+        bam = BamFile()
+
+        if not bam.open_write(Filename.from_os_specific(bundle_path)):
+            raise IOError(f'Could not write {bundle_path}.')
+
+        bam.get_writer().set_file_texture_mode(BamWriter.BTM_rawdata)
+        bam.write_object(model)
+        bam.close()
+
+        textures = {tex.get_fullpath().to_os_specific() for tex in NodePath(model).find_all_textures()
+                    if tex.has_fullpath()}
+        return [path, *sorted(os.path.relpath(file_path, self.root).replace(os.sep, '/') for file_path in textures)]
+
+    def convert_texture(self, path, bundle_path, compress=False):
+        tex = TexturePool.load_texture(Filename.from_os_specific(os.path.join(self.root, path)))
+        tex.generate_ram_mipmap_images()
+
+        if compress:
+            tex.compress_ram_image(Texture.CM_on)
+
+        if not tex.write(Filename.from_os_specific(bundle_path)):
+            raise IOError(f'Could not write {bundle_path}.')
+
+        return [path]
+
+    def build(self, compress=False, force=False):
+        """Convert the assets whose sources have changed, and return the paths of the converted ones.
+        """
+        assets = {}
+        converted = []
+        # models are looked up by the path without the extension, like loader.load_model.
+        jobs = [
+            *((path.removesuffix('.egg'), path, path.removesuffix('.egg') + '.bam', self.convert_model)
+              for path in self.find_assets(self.model_patterns)),
+            *((path, path, path + '.txo', lambda path, bundle_path: self.convert_texture(path, bundle_path, compress))
+              for path in self.find_assets(self.texture_patterns)),
+        ]
+
+        for name, source, bundle, convert in jobs:
+            bundle_path = os.path.join(self.dir, bundle)
+            entry = self.manifest.get(name)
+
+            if not force and entry is not None and entry.get('compress') == compress \
+                    and os.path.exists(bundle_path) and self.is_fresh(entry):
+                assets[name] = entry
+                continue
+
+            os.makedirs(os.path.dirname(bundle_path), exist_ok=True)
+            sources = convert(source, bundle_path)
+            assets[name] = {
+                'bundle': bundle,
+                'compress': compress,
+                'sources': {path: self.get_source(path) for path in sources},
+            }
+            converted.append(name)
+
+        manifest = {'version': self.version, 'panda3d': PandaSystem.get_version_string(), 'assets': assets}
+
+        with open(self.manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=1)
+
+        self.manifest = assets
+        return converted
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--compress', action='store_true', help='store the textures compressed for the GPU.')
+    parser.add_argument('--force', action='store_true', help='convert all the assets even if not changed.')
+    args = parser.parse_args()
+
+    bundle = AssetBundle()
+    converted = bundle.build(args.compress, args.force)
+
+    for name, entry in bundle.manifest.items():
+        size = os.path.getsize(os.path.join(bundle.dir, entry['bundle']))
+        print(f"{'converted' if name in converted else 'unchanged':<10} {size:>10} {entry['bundle']}")
@@ -0,0 +1,150 @@
+import numpy as np
+from panda3d.bullet import BulletHeightfieldShape, ZUp
+from panda3d.core import PNMImage, Filename, Texture, Point3
+
+
+def read_heightfield(file_path):
+    """Return the brightness of the heightfield image from 0 to 1 as (rows, cols) array,
+       whose row index increases with y like the terrain.
+    """
+    img = PNMImage(Filename(file_path))
+    img.make_grayscale()
+    img.remove_alpha()
+
+    tex = Texture('heightfield')
+    tex.load(img)
+    dtype = np.uint16 if tex.get_component_width() == 2 else np.uint8
+    rows, cols = img.get_y_size(), img.get_x_size()
+
+    # the image of a texture is bottom-up.
+    return np.frombuffer(tex.get_ram_image(), dtype=dtype).reshape(rows, cols) / img.get_maxval()
+
+
+def make_heightfield_image(brights):
+    """Return 16 bit grayscale PNMImage of the brightness array; the inverse of read_heightfield.
+    """
+    rows, cols = brights.shape
+    tex = Texture('heightfield')
+    tex.setup_2d_texture(cols, rows, Texture.T_unsigned_short, Texture.F_luminance)
+    tex.set_ram_image(np.round(np.asarray(brights) * 65535).astype(np.uint16).tobytes())
+
+    img = PNMImage()
+    tex.store(img)
+    return img
+
+
+def get_center_area(rows, cols, radius, step):
+    """Return (r0, r1, c0, c1) of the pixels of the heightfield within radius from its center,
+       widened to multiples of step, so that the areas decimated every step pixels meet its edges.
+    """
+    # even, so that diamond subdivision makes the same diagonals as the whole heightfield.
+    unit = int(np.lcm(step, 2))
+    r0 = max(0, int(np.floor(((rows - 1) / 2 - radius) / unit)) * unit)
+    c0 = max(0, int(np.floor(((cols - 1) / 2 - radius) / unit)) * unit)
+    r1 = min(rows - 1, int(np.ceil(((rows - 1) / 2 + radius) / unit)) * unit)
+    c1 = min(cols - 1, int(np.ceil(((cols - 1) / 2 + radius) / unit)) * unit)
+    return r0, r1, c0, c1
+
+
+def make_heightfield_shape(brights, max_height, r0, r1, c0, c1, step=1):
+    """Return BulletHeightfieldShape of the pixels from (r0, c0) to (r1, c1) every step pixels,
+       and its position in the shape of the whole heightfield scaled by 1 / step in x and y.
+       Like BulletHeightfieldShape of the whole image, the heights are centered on 0.
+        Args:
+            brights (numpy.ndarray): returned by read_heightfield.
+            max_height (float): the max height given to BulletHeightfieldShape.
+    """
+    part = brights[r0:r1 + 1:step, c0:c1 + 1:step]
+    shape = BulletHeightfieldShape(make_heightfield_image(part), max_height, ZUp)
+    shape.set_use_diamond_subdivision(True)
+
+    rows, cols = brights.shape
+    # the last pixels sampled; r1 and c1 if they are multiples of step from r0 and c0.
+    r1, c1 = r0 + (part.shape[0] - 1) * step, c0 + (part.shape[1] - 1) * step
+    pos = Point3((c0 + c1 - (cols - 1)) / 2 / step, (r0 + r1 - (rows - 1)) / 2 / step, 0)
+    return shape, pos
+
+
+class HeightSampler:
+    """Heights of the ground made by BulletHeightfieldShape from a heightfield image,
+       answered without the physics world. The image is loaded once into a numpy array,
+       and the heights are interpolated on the same triangles as the shape with diamond subdivision.
+       Args:
+            file_path (str): the heightfield image.
+            max_height (float): the max height given to BulletHeightfieldShape.
+            pos (Point3): the position of the terrain.
+    """
+
+    def __init__(self, file_path, max_height, pos=Point3(0, 0, 0)):
+        brights = read_heightfield(file_path)
+        rows, cols = brights.shape
+        # the shape is centered on its position in all the axes.
+        self.heights = brights * max_height - max_height / 2 + pos.z
+        # rows of python floats, which are faster to look up one by one than the array.
+        self.height_rows = self.heights.tolist()
+        self.rows, self.cols = rows, cols
+        self.x0 = pos.x - (cols - 1) / 2
+        self.y0 = pos.y - (rows - 1) / 2
+
+    def get_height(self, x, y):
+        """Return z of the ground at (x, y); nan outside the terrain.
+        """
+        gx = x - self.x0
+        gy = y - self.y0
+
+        if not (0 <= gx <= self.cols - 1 and 0 <= gy <= self.rows - 1):
+            return float('nan')
+
+        c = min(int(gx), self.cols - 2)
+        r = min(int(gy), self.rows - 2)
+        fx, fy = gx - c, gy - r
+
+        row, next_row = self.height_rows[r], self.height_rows[r + 1]
+        h00, h10 = row[c], row[c + 1]
+        h01, h11 = next_row[c], next_row[c + 1]
+
+        if (r + c) % 2 == 0:
+            # the diagonal from (0, 0) to (1, 1).
+            if fx >= fy:
+                return h00 + fx * (h10 - h00) + fy * (h11 - h10)
+            return h00 + fy * (h01 - h00) + fx * (h11 - h01)
+
+        # the diagonal from (1, 0) to (0, 1).
+        if fx + fy <= 1:
+            return h00 + fx * (h10 - h00) + fy * (h01 - h00)
+        return h11 + (1 - fx) * (h01 - h11) + (1 - fy) * (h10 - h11)
+
+    def get_heights(self, x, y):
+        """Return numpy.ndarray of z of the ground at the points; nan outside the terrain.
+           Args:
+                x (array_like): x coordinates of the points.
+                y (array_like): y coordinates of the points; the same shape as x.
+        """
+        gx = np.asarray(x, dtype=np.float64) - self.x0
+        gy = np.asarray(y, dtype=np.float64) - self.y0
+
+        c = np.clip(np.floor(gx), 0, self.cols - 2).astype(np.intp)
+        r = np.clip(np.floor(gy), 0, self.rows - 2).astype(np.intp)
+        fx, fy = gx - c, gy - r
+
+        h00 = self.heights[r, c]
+        h10 = self.heights[r, c + 1]
+        h01 = self.heights[r + 1, c]
+        h11 = self.heights[r + 1, c + 1]
+
+        z = np.where(
+            (r + c) % 2 == 0,
+            np.where(
+                fx >= fy,
+                h00 + fx * (h10 - h00) + fy * (h11 - h10),
+                h00 + fy * (h01 - h00) + fx * (h11 - h01)
+            ),
+            np.where(
+                fx + fy <= 1,
+                h00 + fx * (h10 - h00) + fy * (h01 - h00),
+                h11 + (1 - fx) * (h01 - h11) + (1 - fy) * (h10 - h11)
+            )
+        )
+
+        outside = (gx < 0) | (gx > self.cols - 1) | (gy < 0) | (gy > self.rows - 1)
+        return np.where(outside, np.nan, z)
@@ -1,12 +1,20 @@
+import copy
+import threading
+from collections import defaultdict
 from typing import NamedTuple
 from enum import Enum, auto
 
 from panda3d.bullet import BulletRigidBodyNode, BulletBoxShape
-from panda3d.core import NodePath, TextureStage
+from panda3d.bullet import BulletTriangleMesh, BulletTriangleMeshShape
+from panda3d.core import NodePath, PandaNode, TextureStage, TransformState
 from panda3d.core import Vec3, Point3, BitMask32, Point2
 
 from maze_algorithm import WallExtendingAlgorithm
 from shapes import Box
+from .maze_graph import MazeGraph
+from .profiler import profiler
+from .assets import assets
+from .wall_mesh import ChunkTree, WallMesh, WallInstances, SIDES, merge_rectangles, supports_instancing
 
 
 class Corners(Enum):
@@ -17,20 +25,74 @@ class Corners(Enum):
     BOTTOM_RIGHT = auto()
 
 
+class RenderMode(Enum):
+
+    BLOCK = auto()   # a Block NodePath for each wall cell.
+    MESH = auto()    # batched meshes made from the grid.
+    INSTANCED = auto()   # a geom of one cell drawn for each wall cell by hardware instancing.
+
+
+class PhysicsMode(Enum):
+
+    BLOCK = auto()           # a rigid body for each wall cell.
+    COMPOUND = auto()        # a rigid body of merged boxes for each collide mask.
+    TRIANGLE_MESH = auto()   # a rigid body of a triangle mesh for each collide mask.
+
+
 class Block(NodePath):
+    """A wall block. The blocks of the same size share a Geom and a BulletBoxShape.
+    """
+
+    models = {}
+    shapes = {}
 
     def __init__(self, name, pos, size, mask):
         super().__init__(BulletRigidBodyNode(name))
-        cube_maker = Box(width=size.x, depth=size.y, height=size.z)
-        cube = cube_maker.create()
-        self.model = self.attach_new_node(cube.node())
+        self.size = tuple(size)
+
+        if self.size not in self.models:
+            cube_maker = Box(width=size.x, depth=size.y, height=size.z)
+            cube = cube_maker.create()
+            end, tip = cube.get_tight_bounds()
+            self.models[self.size] = cube
+            self.shapes[self.size] = BulletBoxShape((tip - end) / 2)
+
+        self.model = self.models[self.size].copy_to(self)
+        self.node().add_shape(self.shapes[self.size])
+        self.node().set_mass(0)
+        self.reset(name, pos, mask)
 
+    def reset(self, name, pos, mask):
+        self.set_name(name)
         self.set_pos(pos)
         self.set_collide_mask(mask)
+        self.show()
 
-        end, tip = self.model.get_tight_bounds()
-        self.node().add_shape(BulletBoxShape((tip - end) / 2))
-        self.node().set_mass(0)
+
+class BlockPool:
+    """Keep the blocks removed from a maze, to reuse them in the next maze.
+    """
+
+    def __init__(self):
+        self.blocks = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def get(self, name, pos, size, mask):
+        with self.lock:
+            blocks = self.blocks[tuple(size)]
+            block = blocks.pop() if blocks else None
+
+        if block is None:
+            return Block(name, pos, size, mask)
+
+        block.reset(name, pos, mask)
+        return block
+
+    def release(self, block):
+        block.detach_node()
+
+        with self.lock:
+            self.blocks[block.size].append(block)
 
 
 class Space(NamedTuple):
@@ -40,13 +102,44 @@ class Space(NamedTuple):
 
 
 class MazeBuilder:
-
-    def __init__(self, world, parent):
+    """Build a maze from the grid created by WallExtendingAlgorithm.
+        Args:
+            world (panda3d.bullet.BulletWorld)
+            parent (NodePath)
+            render_mode (RenderMode): BLOCK draws a Block for each wall cell;
+                MESH draws the visible faces of the walls as a few GeomNodes per material;
+                INSTANCED draws one instanced geom per material, falling back to MESH
+                if the window does not support shaders or instancing.
+            physics_mode (PhysicsMode): BLOCK makes a rigid body for each wall cell;
+                COMPOUND and TRIANGLE_MESH make one static body for each collide mask.
+            chunk_size (int): the number of rows and columns of a chunk; the walls are
+                grouped by chunks into a quadtree for the cull traversal.
+            visible_radius (float): the distance from the camera beyond which a chunk
+                is not drawn; None to draw all chunks.
+            levels (maze_algorithm.cache.MazeCache): pre-generated mazes; a maze of a seed found in it
+                is loaded instead of created.
+    """
+
+    def __init__(self, world, parent, render_mode=RenderMode.BLOCK,
+                 physics_mode=PhysicsMode.BLOCK, chunk_size=16, visible_radius=None, levels=None):
         self.world = world
+        self.levels = levels
+        self.render_mode = render_mode
+        self.physics_mode = physics_mode
+        self.chunk_size = chunk_size
+        self.visible_radius = visible_radius
         self.wall_size = Vec3(2, 2, 4)
         self.np_walls = NodePath('walls')
         self.np_walls.reparent_to(parent)
         self.np_walls.set_pos(0, 0, -12)
+        self.bodies = []
+        self.blocks = []
+        self.pool = BlockPool()
+        self.box_shapes = {}
+        self.seed = None
+
+        self.tex_brick = assets.get_texture('textures/brick.jpg')
+        self.tex_stone = assets.get_texture('textures/concrete2.jpg')
 
     def get_maze_pos(self):
         return self.np_walls.get_pos()
@@ -57,17 +150,68 @@ class MazeBuilder:
     def get_exit(self):
         return self.space_to_cartesian(*self.exit)
 
+    def get_radius(self, rows, cols):
+        """Return the half width of the square around the center of a maze of the size,
+           which the walls of the maze fit in.
+        """
+        return max((cols // 2 + 0.5) * self.wall_size.x, (rows // 2 + 0.5) * self.wall_size.y)
+
     def space_to_cartesian(self, row, col):
         x = (col - self.cols // 2) * self.wall_size.x
         y = (-row + self.rows // 2) * self.wall_size.y
         return Point2(x, y)
 
-    def setup(self, rows, cols):
+    def cartesian_to_space(self, pt2):
+        row = self.rows // 2 - round(pt2.y / self.wall_size.y)
+        col = self.cols // 2 + round(pt2.x / self.wall_size.x)
+        return Space(row, col)
+
+    def setup(self, rows, cols, seed=None):
         """Build a maze.
             Args:
                 rows (int): the number of rows; must be odd.
                 cols (int): the number of columns; must be odd.
+                seed (int): seed for WallExtendingAlgorithm; None for a random maze.
+        """
+        self.attach(self.prepare(rows, cols, seed))
+
+    def prepare(self, rows, cols, seed=None):
+        """Return a copy of this builder on which a new maze is built.
+           Nothing is attached to the scene graph or the Bullet world,
+           so that this can be called in a thread other than the main thread.
+            Args:
+                rows (int): the number of rows; must be odd.
+                cols (int): the number of columns; must be odd.
+                seed (int): seed for WallExtendingAlgorithm; None for a random maze.
+        """
+        maze = copy.copy(self)
+        maze.seed = seed
+        maze.np_walls = NodePath('walls')
+        maze.bodies = []
+        maze.blocks = []
+        maze.set_layout(rows, cols)
+        maze.build()
+
+        return maze
+
+    def attach(self, maze):
+        """Show the maze returned by prepare() and attach its bodies to the Bullet world.
         """
+        self.set_layout(maze.rows, maze.cols)
+        self.bodies = maze.bodies
+        self.blocks = maze.blocks
+        self.graph = maze.graph
+        self.seed = maze.seed
+
+        for np in maze.np_walls.get_children():
+            np.reparent_to(self.np_walls)
+
+        for body in self.bodies:
+            # the bodies were made under a detached node; let Bullet take their new net transform.
+            body.node().set_transform_dirty()
+            self.world.attach(body.node())
+
+    def set_layout(self, rows, cols):
         self.rows = rows if rows % 2 != 0 else rows - 1
         self.cols = cols if cols % 2 != 0 else cols - 1
 
@@ -78,12 +222,14 @@ class MazeBuilder:
         self.entrance = (0, 1)
         self.exit = (self.rows - 1, self.cols - 2)
 
-        self.build()
+    def create_grid(self):
+        if self.levels is not None and (grid := self.levels.get(self.rows, self.cols, self.seed)) is not None:
+            return grid
 
-    def build(self):
-        tex_brick = base.loader.load_texture('textures/brick.jpg')
-        tex_stone = base.loader.load_texture('textures/concrete2.jpg')
+        return WallExtendingAlgorithm(self.rows, self.cols, self.seed).create_maze()
 
+    @profiler.profile('MazeBuilder.build')
+    def build(self):
         np_brick = NodePath('brick')
         np_stone = NodePath('stone')
         np_closure = NodePath('closure')
@@ -91,44 +237,199 @@ class MazeBuilder:
         for np in [np_brick, np_stone, np_closure]:
             np.reparent_to(self.np_walls)
 
-        grid = WallExtendingAlgorithm(self.rows, self.cols).create_maze()
+        grid = self.create_grid()
+        # the exit is a hidden wall, which does not stop aircrafts.
+        self.graph = MazeGraph(grid, [self.exit])
         stone_size = Vec3(self.wall_size.xy, 0.25)
+
+        match self.render_mode:
+            case RenderMode.BLOCK:
+                self.make_blocks(grid, stone_size, np_brick, np_stone)
+
+            case RenderMode.MESH:
+                self.make_meshes(grid, stone_size, np_brick, np_stone)
+
+            case RenderMode.INSTANCED:
+                if supports_instancing():
+                    self.make_instances(grid, stone_size, np_brick, np_stone)
+                else:
+                    self.make_meshes(grid, stone_size, np_brick, np_stone)
+
+        # the size of a brick and a stone piled up.
+        body_size = Vec3(self.wall_size.xy, self.wall_size.z + stone_size.z)
+
+        match self.physics_mode:
+            case PhysicsMode.BLOCK:
+                if self.render_mode != RenderMode.BLOCK:
+                    self.make_bodies(grid, body_size)
+
+            case PhysicsMode.COMPOUND:
+                self.make_compound_bodies(grid, body_size)
+
+            case PhysicsMode.TRIANGLE_MESH:
+                self.make_triangle_mesh_bodies(grid, body_size)
+
+        su = (self.wall_size.x + self.wall_size.y) / 3
+        sv = self.wall_size.z / 2
+        np_brick.set_tex_scale(TextureStage.get_default(), su, sv)
+
+        np_brick.set_texture(self.tex_brick)
+        np_stone.set_texture(self.tex_stone)
+
+    def get_mask(self, r, c):
+        """Return the collide mask of the wall cell and whether it is hidden.
+        """
+        match (r, c):
+            case self.exit:
+                return BitMask32.bit(3), True
+            case self.entrance:
+                return BitMask32.bit(2) | BitMask32.bit(4), True
+            case _:
+                return BitMask32.bit(2) | BitMask32.bit(4), False
+
+    def split_by_mask(self, grid):
+        """Yield a collide mask and a boolean array of the wall cells having the mask.
+        """
+        walls = grid == 1
+        exit = walls.copy()
+        exit.fill(False)
+        exit[self.exit] = walls[self.exit]
+        walls[self.exit] = False
+
+        yield BitMask32.bit(2) | BitMask32.bit(4), walls
+        yield BitMask32.bit(3), exit
+
+    def get_chunk_center(self, row, col, z):
+        """Return the center of the chunk (row, col) at the height z.
+        """
+        r = min(row * self.chunk_size + self.chunk_size // 2, self.rows - 1)
+        c = min(col * self.chunk_size + self.chunk_size // 2, self.cols - 1)
+        return Point3(self.space_to_cartesian(r, c), z)
+
+    def make_blocks(self, grid, stone_size, np_brick, np_stone):
         brick_z = self.wall_size.z / 2
         stone_z = self.wall_size.z + stone_size.z / 2
+        bricks = ChunkTree('bricks', self.visible_radius)
+        stones = ChunkTree('stones', self.visible_radius)
+        chunks = {}   # (row, col) of the chunk: [brick chunk, stone chunk]
 
         for r in range(self.rows):
             for c in range(self.cols):
                 if grid[r, c] == 1:
                     xy = self.space_to_cartesian(r, c)
+                    mask, hide = self.get_mask(r, c)
+
+                    if (key := (r // self.chunk_size, c // self.chunk_size)) not in chunks:
+                        center = self.get_chunk_center(*key, self.wall_size.z / 2)
+                        chunks[key] = [tree.add_chunk(*key, NodePath(PandaNode(f'{tree.get_name()}_{key[0]}_{key[1]}')), center)
+                                       for tree in (bricks, stones)]
+
+                    brick_chunk, stone_chunk = chunks[key]
+                    brick = self.make_block(f'brick_{r}_{c}', Point3(xy, brick_z), self.wall_size, mask, hide, brick_chunk, False)
+                    stone = self.make_block(f'top_{r}_{c}', Point3(xy, stone_z), stone_size, mask, hide, stone_chunk, False)
+
+                    if self.physics_mode == PhysicsMode.BLOCK:
+                        self.bodies.extend([brick, stone])
+
+        for tree, parent in [(bricks, np_brick), (stones, np_stone)]:
+            tree.build()
+            tree.reparent_to(parent)
+
+    def get_visible_walls(self, grid):
+        visible = grid == 1
+
+        for r, c in [self.entrance, self.exit]:
+            visible[r, c] = False
+
+        return visible
+
+    def make_meshes(self, grid, stone_size, np_brick, np_stone):
+        visible = self.get_visible_walls(grid)
+        origin = self.space_to_cartesian(0, 0)
+        # the top of bricks is covered with stones, and the bottom of stones lies on bricks.
+        bricks = WallMesh('bricks', visible, self.wall_size, origin, 0, SIDES,
+                          self.chunk_size, self.visible_radius)
+        stones = WallMesh('stones', visible, stone_size, origin, self.wall_size.z, SIDES + ('top',),
+                          self.chunk_size, self.visible_radius)
+        bricks.reparent_to(np_brick)
+        stones.reparent_to(np_stone)
+
+    def make_instances(self, grid, stone_size, np_brick, np_stone):
+        visible = self.get_visible_walls(grid)
+        origin = self.space_to_cartesian(0, 0)
+        bricks = WallInstances('bricks', visible, self.wall_size, origin, 0, SIDES)
+        stones = WallInstances('stones', visible, stone_size, origin, self.wall_size.z, SIDES + ('top',))
+        bricks.reparent_to(np_brick)
+        stones.reparent_to(np_stone)
+
+    def make_bodies(self, grid, size):
+        """Make a hidden block for each wall cell for collision.
+        """
+        np_bodies = self.np_walls.attach_new_node('bodies')
 
-                    match (r, c):
-                        case self.exit:
-                            mask = BitMask32.bit(3)
-                            hide = True
-                        case self.entrance:
-                            mask = BitMask32.bit(2) | BitMask32.bit(4)
-                            hide = True
-                        case _:
-                            mask = BitMask32.bit(2) | BitMask32.bit(4)
-                            hide = False
+        for r, c in zip(*(grid == 1).nonzero()):
+            xy = self.space_to_cartesian(r, c)
+            mask, _ = self.get_mask(r, c)
+            block = self.make_block(f'wall_{r}_{c}', Point3(xy, size.z / 2), size, mask, True, np_bodies, False)
+            self.bodies.append(block)
 
-                    self.make_block(f'brick_{r}_{c}', Point3(xy, brick_z), self.wall_size, mask, hide, np_brick)
-                    self.make_block(f'top_{r}_{c}', Point3(xy, stone_z), stone_size, mask, hide, np_stone)
+    def make_compound_bodies(self, grid, size):
+        """Make a rigid body for each collide mask, made of the boxes
+           each of which covers a rectangle of the wall cells.
+        """
+        np_bodies = self.np_walls.attach_new_node('bodies')
 
-        su = (self.wall_size.x + self.wall_size.y) / 3
-        sv = self.wall_size.z / 2
-        np_brick.set_tex_scale(TextureStage.get_default(), su, sv)
+        for i, (mask, walls) in enumerate(self.split_by_mask(grid)):
+            body = np_bodies.attach_new_node(BulletRigidBodyNode(f'walls_{i}'))
+
+            for r, c, h, w in merge_rectangles(walls).tolist():
+                half = Vec3(w * size.x, h * size.y, size.z) / 2
+
+                if (key := (w, h)) not in self.box_shapes:
+                    self.box_shapes[key] = BulletBoxShape(half)
+
+                # the center of the rectangle.
+                xy = (self.space_to_cartesian(r, c) + self.space_to_cartesian(r + h - 1, c + w - 1)) / 2
+                body.node().add_shape(self.box_shapes[key], TransformState.make_pos(Point3(xy, half.z)))
+
+            self.setup_body(body, mask)
 
-        np_brick.set_texture(tex_brick)
-        np_stone.set_texture(tex_stone)
+    def make_triangle_mesh_bodies(self, grid, size):
+        """Make a rigid body for each collide mask, made of the triangle mesh
+           of the faces of the wall cells that are not hidden by their neighbors.
+        """
+        np_bodies = self.np_walls.attach_new_node('bodies')
+        origin = self.space_to_cartesian(0, 0)
+
+        for i, (mask, walls) in enumerate(self.split_by_mask(grid)):
+            body = np_bodies.attach_new_node(BulletRigidBodyNode(f'walls_{i}'))
+            mesh = BulletTriangleMesh()
+            faces = WallMesh(f'walls_{i}', walls, size, origin, 0, SIDES + ('top',), max(self.rows, self.cols))
+
+            for geom_node in faces.get_geom_nodes():
+                mesh.add_geom(geom_node.get_geom(0))
+
+            if mesh.get_num_triangles():
+                body.node().add_shape(BulletTriangleMeshShape(mesh, dynamic=False))
+
+            self.setup_body(body, mask)
 
-    def make_block(self, name, pos, size, mask, hide=False, parent=None):
+    def setup_body(self, body, mask):
+        body.set_collide_mask(mask)
+        body.node().set_mass(0)
+        self.bodies.append(body)
+
+    def make_block(self, name, pos, size, mask, hide=False, parent=None, attach=True):
         if parent is None:
             parent = self.np_walls.find('closure')
 
-        block = Block(name, pos, size, mask)
+        block = self.pool.get(name, pos, size, mask)
         block.reparent_to(parent)
-        self.world.attach(block.node())
+        self.blocks.append(block)
+
+        if attach:
+            self.world.attach(block.node())
+            self.bodies.append(block)
 
         if hide:
             block.hide()
@@ -143,8 +444,13 @@ class MazeBuilder:
             return True
 
     def destroy(self):
+        for body in self.bodies:
+            self.world.remove(body.node())
+        self.bodies = []
+
+        for block in self.blocks:
+            self.pool.release(block)
+        self.blocks = []
+
         for np in self.np_walls.get_children():
-            for block in np.get_children():
-                self.world.remove(block.node())
-                block.remove_node()
             np.remove_node()
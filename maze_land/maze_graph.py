@@ -0,0 +1,175 @@
+import heapq
+
+import numpy as np
+
+
+class MazeGraph:
+    """Routing index of a maze, built once from the grid.
+       The nodes are the junctions and the dead ends, and the edges are the corridors between them.
+       Every passage cell knows the two nodes at the ends of its corridor and the steps to them,
+       so a distance field to a target cell is made by Dijkstra over the nodes only,
+       after which the distance from any cell to the target is looked up in O(1).
+       Args:
+            grid (numpy.ndarray): 1 for walls and 0 for passages; created by WallExtendingAlgorithm.
+            openings (list of tuple): (row, col) of the wall cells which can be passed; e.g. the exit.
+    """
+
+    def __init__(self, grid, openings=()):
+        self.rows, self.cols = grid.shape
+        # the grid is padded with walls, so that a flat index never wraps around to the next row.
+        self.width = self.cols + 2
+        # (0, 1), (0, -1), (1, 0), (-1, 0) as the offsets in the flat grid.
+        self.offsets = (1, -1, self.width, -self.width)
+
+        passable = np.asarray(grid) == 0
+
+        for cell in openings:
+            passable[cell] = True
+
+        self.passable = np.pad(passable, 1, constant_values=False).ravel()
+        self.nodes = []                                   # flat indices of the node cells
+        self.adjacency = []                               # [(node, steps), ...] for each node
+        self.node_of = np.full(self.passable.size, -1)    # node index of the node cells
+        self.edge_of = np.full(self.passable.size, -1)    # corridor index of the corridor cells
+        self.ends = np.zeros((self.passable.size, 2), dtype=np.int64)
+        self.steps = np.zeros((self.passable.size, 2), dtype=np.int64)
+
+        self.targets = {}   # name: (row, col) of the target
+        self.fields = {}    # name: (rows, cols) array of the distances to the target
+        self.build()
+
+    def to_flat(self, row, col):
+        return (row + 1) * self.width + col + 1
+
+    def to_cell(self, pt):
+        return pt // self.width - 1, pt % self.width - 1
+
+    def is_inside(self, row, col):
+        return 0 <= row < self.rows and 0 <= col < self.cols
+
+    def is_open(self, row, col):
+        """Return True if the cell can be passed. The outside of the maze is open.
+        """
+        if not self.is_inside(row, col):
+            return True
+
+        return bool(self.passable[self.to_flat(row, col)])
+
+    def get_passages(self):
+        """Return the rows and columns of the passage cells, except the ones on the border.
+        """
+        passable = self.passable.reshape(self.rows + 2, self.width)[2:-2, 2:-2]
+        rows, cols = np.nonzero(passable)
+        return rows + 1, cols + 1
+
+    def neighbors(self, pt):
+        return [pt + d for d in self.offsets if self.passable[pt + d]]
+
+    def add_node(self, pt):
+        self.node_of[pt] = len(self.nodes)
+        self.ends[pt] = self.node_of[pt]
+        self.nodes.append(pt)
+        self.adjacency.append([])
+
+    def build(self):
+        degrees = sum(np.roll(self.passable, d) for d in self.offsets)
+
+        for pt in np.flatnonzero(self.passable & (degrees != 2)):
+            self.add_node(pt)
+
+        i = 0
+
+        while True:
+            while i < len(self.nodes):
+                self.walk_corridors(i)
+                i += 1
+
+            # the passages making a loop without any junction; not found in a perfect maze.
+            if not len(loops := np.flatnonzero(self.passable & (self.node_of < 0) & (self.edge_of < 0))):
+                break
+
+            self.add_node(loops[0])
+
+    def walk_corridors(self, n):
+        """Follow every corridor starting from the node n to the node at the other end.
+        """
+        start = self.nodes[n]
+
+        for pt in self.neighbors(start):
+            if self.edge_of[pt] >= 0:
+                # already followed from the other end.
+                continue
+
+            prev, path = start, []
+
+            while self.node_of[pt] < 0:
+                path.append(pt)
+                prev, pt = pt, next(p for p in self.neighbors(pt) if p != prev)
+
+            if not path and self.node_of[pt] < n:
+                # two nodes next to each other; the edge was added from the other node.
+                continue
+
+            m = self.node_of[pt]
+            edge = len(path) + 1
+            self.adjacency[n].append((m, edge))
+            self.adjacency[m].append((n, edge))
+
+            if path:
+                path = np.array(path)
+                self.edge_of[path] = path[0]
+                self.ends[path] = (n, m)
+                self.steps[path, 0] = np.arange(1, len(path) + 1)
+                self.steps[path, 1] = edge - self.steps[path, 0]
+
+    def distance_field(self, row, col):
+        """Return (rows, cols) array of the steps from each cell to the cell (row, col);
+           inf for the cells which cannot be passed or from which the cell cannot be reached.
+        """
+        target = self.to_flat(row, col)
+        dists = np.full(len(self.nodes), np.inf)
+        heap = [(self.steps[target, k], self.ends[target, k]) for k in range(2)]
+
+        while heap:
+            dist, n = heapq.heappop(heap)
+
+            if dist >= dists[n]:
+                continue
+
+            dists[n] = dist
+
+            for m, edge in self.adjacency[n]:
+                if dist + edge < dists[m]:
+                    heapq.heappush(heap, (dist + edge, m))
+
+        field = np.minimum(
+            self.steps[:, 0] + dists[self.ends[:, 0]],
+            self.steps[:, 1] + dists[self.ends[:, 1]]
+        )
+
+        # the cells on the same corridor as the target.
+        if (edge := self.edge_of[target]) >= 0:
+            same = self.edge_of == edge
+            field[same] = np.minimum(field[same], np.abs(self.steps[same, 0] - self.steps[target, 0]))
+
+        field[~self.passable] = np.inf
+        return field.reshape(self.rows + 2, self.width)[1:-1, 1:-1]
+
+    def set_target(self, name, row, col):
+        """Make the distance field to the cell (row, col) under the name,
+           unless the target has not moved or cannot be passed.
+        """
+        if self.targets.get(name) == (row, col) or not self.is_inside(row, col):
+            return
+
+        if self.passable[self.to_flat(row, col)]:
+            self.targets[name] = (row, col)
+            self.fields[name] = self.distance_field(row, col)
+
+    def distance(self, name, row, col):
+        """Return the steps from the cell (row, col) to the target of the name.
+        """
+        if not self.is_inside(row, col) or name not in self.fields:
+            return np.inf
+
+        return self.fields[name][row, col]
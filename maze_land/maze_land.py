@@ -1,21 +1,26 @@
+import time
+IMPORT_START = time.perf_counter()
+
 import math
 import sys
 from collections import deque
 
-from panda3d.bullet import BulletWorld, BulletDebugNode
+import numpy as np
 from panda3d.core import Vec3, NodePath, Point3, LColor, Vec2, Vec4
 from direct.showbase.ShowBase import ShowBase
 from direct.showbase.ShowBaseGlobal import globalClock
 from direct.showbase.InputStateGlobal import inputState
 from panda3d.core import load_prc_file_data
-from panda3d.core import Camera
+from panda3d.core import Camera, ClockObject
 
-from .scene import Scene
-from .aircraft import Aircraft
-from .maze_walker import MazeWalker
-from .basic_character import Direction, Status, BodyColor
-from .maze3D import Corners
+# Bullet, the scene and the characters are imported when the game is built behind the start screen.
+from .basic_character import Direction, Status
 from .screen import Screen, Button, Frame, Label
+from .replay import Event, ReplayRecorder, ReplayPlayer
+from .profiler import profiler, ProfileOverlay
+from .assets import assets
+
+IMPORT_TIME = time.perf_counter() - IMPORT_START
 
 
 load_prc_file_data("", """
@@ -110,102 +115,238 @@ class CameraController:
 
 
 class MazeLand(ShowBase):
+    """The game. The time step and the inputs of every frame go through the session,
+       so that a recorded session is played back in the same frames.
+       The window and the start screen appear first, and the physics world, the scene,
+       the characters and the first maze are built behind it, one stage a frame;
+       the session starts when all of them are built.
+        Args:
+            session (ReplayRecorder or ReplayPlayer): gives the time step and the inputs of every frame;
+                ReplayRecorder with a random seed if not given.
+            record_path (str): the file to which the recorded session is saved at the end of each round and at exit.
+            levels (maze_algorithm.cache.MazeCache): pre-generated mazes from which the mazes are chosen.
+    """
+
+    # False to build the next maze in the main thread.
+    threaded_maze = True
+    # False to build the game in __init__ instead of behind the start screen.
+    staged_startup = True
+
+    def __init__(self, session=None, record_path=None, levels=None):
+        # the files are loaded in threads while the window opens and the game is built.
+        self.start_time = time.perf_counter()
+        self.phase_start = self.start_time
+        self.startup_times = {'imports': IMPORT_TIME}
+        self.first_frame_time = None
+        self.ready_time = None
+        assets.preload()
 
-    def __init__(self):
         super().__init__()
         self.set_background_color(LColor(1, 1, 1, 1))
         self.disable_mouse()
 
+        self.session = ReplayRecorder() if session is None else session
+        self.record_path = record_path
+        self.levels = levels
+        self.events = Event(0)
+        self.walker_state = None
+        self.aircrafts_state = None
+        self.state = None
+        self.log_phase('window')
+
+        self.create_gui()
+        self.log_phase('gui')
+
+        inputState.watch_with_modifiers('forward', 'arrow_up')
+        inputState.watch_with_modifiers('backward', 'arrow_down')
+        inputState.watch_with_modifiers('left', 'arrow_left')
+        inputState.watch_with_modifiers('right', 'arrow_right')
+        inputState.watch_with_modifiers('jump', 'enter')
+
+        # self.accept('escape', sys.exit)
+        self.accept('p', self.print_info)
+        profiler.add_tasks(self.taskMgr)
+        # just after igLoop, whose sort is 50.
+        self.taskMgr.add(self.measure_startup, 'measure_startup', sort=52)
+        self.stages = self.build_stages()
+
+        if self.staged_startup:
+            self.taskMgr.add(self.build_stage, 'build_stage')
+        else:
+            for _ in self.stages:
+                pass
+
+    def log_phase(self, name):
+        now = time.perf_counter()
+        self.startup_times[name] = now - self.phase_start
+        self.phase_start = now
+
+    def build_stages(self):
+        """Build the game a stage at a time; yield after each stage, and every frame
+           while waiting for the first maze built in the background.
+        """
+        from panda3d.bullet import BulletWorld, BulletDebugNode
+        from .scene import Scene
+        from .aircraft import AircraftSwarm
+        from .maze_walker import MazeWalker
+        self.log_phase('lazy imports')
+        yield
+
         self.world = BulletWorld()
         self.world.set_gravity(Vec3(0, 0, -9.81))
-        self.scene = Scene(self.world)
+        self.debug = self.render.attach_new_node(BulletDebugNode('debug'))
+        self.world.set_debug_node(self.debug.node())
+
+        playback = isinstance(self.session, ReplayPlayer)
+        maze_seed, aircraft_seed = np.random.SeedSequence(self.session.seed).spawn(2)
+        self.scene = Scene(self.world, maze_seed, threaded=self.threaded_maze and not playback, levels=self.levels)
+        # the first maze is built in the background like the next ones.
+        self.scene.prepare_maze()
+        self.log_phase('scene')
+        yield
 
-        self.aircraft_1 = Aircraft(self.world, self.scene.maze, BodyColor.BLUE, bit=6)
-        self.aircraft_2 = Aircraft(self.world, self.scene.maze, BodyColor.RED, bit=7)
+        self.aircrafts = AircraftSwarm(self.scene.maze, n=2, seed=aircraft_seed)
 
         self.walker_q = deque()
-        self.walker = MazeWalker(self.world, self.scene.maze, self.walker_q)
+        self.walker = MazeWalker(
+            self.world, self.scene.maze, self.walker_q, height_sampler=self.scene.terrain.height_sampler)
         self.floater = NodePath('floater')
         self.floater.set_z(1)   # 3
         self.floater.reparent_to(self.walker.body)
 
         # self.create_display_regions()
         self.split_screen()
-        self.create_gui()
+        self.log_phase('characters')
+        yield
+
+        while not self.scene.is_maze_prepared():
+            yield
+
         self.set_up_game()
+        self.log_phase('maze')
+        self.start_session()
 
-        self.accident_aircrafts = []
-        self.walker_state = None
-        self.aircrafts_state = None
-        self.state = None
+    def build_stage(self, task):
+        for _ in self.stages:
+            return task.cont
 
-        self.debug = self.render.attach_new_node(BulletDebugNode('debug'))
-        self.world.set_debug_node(self.debug.node())
+        return task.done
 
-        inputState.watch_with_modifiers('forward', 'arrow_up')
-        inputState.watch_with_modifiers('backward', 'arrow_down')
-        inputState.watch_with_modifiers('left', 'arrow_left')
-        inputState.watch_with_modifiers('right', 'arrow_right')
-        inputState.watch_with_modifiers('jump', 'enter')
+    def start_session(self):
+        """Start the frames given by the session, after the game is built.
+        """
+        # the frame time is given by the session, so that the intervals are played back in the same frames.
+        self.clock_time = 0.0
+        globalClock.set_mode(ClockObject.M_slave)
+        globalClock.set_frame_time(self.clock_time)
 
-        # self.accept('escape', sys.exit)
         self.accept('d', self.toggle_debug)
-        self.accept('p', self.print_info)
         self.accept('finish', self.finish)
+        self.accept('replay_end', self.exit_game)
+        self.taskMgr.add(self.tick, 'tick', sort=-100)
         self.taskMgr.add(self.update, 'update')
 
-    def create_gui(self):
-        font = self.loader.loadFont('font/Candaral.ttf')
+        self.ready_time = time.perf_counter() - self.start_time
+        self.messenger.send('game_ready')
 
-        def _initialize():
-            self.state = Status.INITIALIZE
+    def create_gui(self):
+        font = assets.get_font('font/Candaral.ttf')
 
         self.again_frame = Frame()
         Label(self.again_frame, 'Try Again', (0, 0, 0.3), font)
-        Button(self.again_frame, 'START', (0, 0, 0), font, command=_initialize, focus=True)
-        Button(self.again_frame, 'EXIT', (0, 0, -0.2), font, command=sys.exit)
+        again_button = Button(self.again_frame, 'START', (0, 0, 0), font,
+                              command=lambda: self.request(Event.INITIALIZE), focus=True)
+        Button(self.again_frame, 'EXIT', (0, 0, -0.2), font, command=self.exit_game)
         self.again_frame.display(False)
 
         start_frame = Frame()
         Label(start_frame, 'Maze Land', (0, 0, 0.3), font)
-        Button(start_frame, 'START', (0, 0, 0), font, command=lambda: self.screen.fade_out(self.start_game), focus=True)
-        Button(start_frame, 'EXIT', (0, 0, -0.2), font, command=sys.exit)
+        start_button = Button(start_frame, 'START', (0, 0, 0), font,
+                              command=lambda: self.request(Event.START), focus=True)
+        Button(start_frame, 'EXIT', (0, 0, -0.2), font, command=self.exit_game)
+        # the game can be started after it is built behind the start screen.
+        start_button.enable(False)
+
+        # a replay starts the rounds by the recorded events, not by the buttons.
+        if isinstance(self.session, ReplayPlayer):
+            again_button.enable(False)
+        else:
+            self.accept_once('game_ready', start_button.enable)
 
         self.screen = Screen(start_frame)
 
-    def finish(self):
-        def _finish():
-            self.accept('escape', sys.exit)
-            for obj in [self.walker, self.aircraft_1, self.aircraft_2]:
-                obj.state = None
+        self.profile_overlay = ProfileOverlay(profiler)
+        self.accept('t', self.profile_overlay.toggle)
+        self.accept('y', self.dump_profile)
+
+    def request(self, event):
+        """Apply the event at the start of the next frame.
+        """
+        self.events |= event
+
+    def apply_events(self, events):
+        if Event.STOP in events:
+            self.accept('escape', self.exit_game)
+            self.walker.state = None
+            self.aircrafts.clear_states()
 
+        if Event.INITIALIZE in events:
+            self.state = Status.INITIALIZE
+
+        if Event.SET_UP in events:
+            self.restart_game()
+
+        if Event.START in events:
+            self.start_game()
+
+    def save_replay(self):
+        if self.record_path is not None and isinstance(self.session, ReplayRecorder):
+            self.session.get_replay().save(self.record_path)
+
+    def dump_profile(self):
+        if profiler.enabled:
+            profiler.dump(time.strftime('profile_%Y%m%d_%H%M%S.json'))
+
+    def exit_game(self):
+        self.save_replay()
+        sys.exit()
+
+    def finish(self):
         self.ignore('escape')
+        self.save_replay()
+        self.scene.prepare_maze()
         self.screen.frame = self.again_frame
-        self.screen.fade_in(_finish)
+        self.screen.fade_in(self.request, Event.STOP)
 
     def set_up_game(self):
+        from .maze3D import Corners
+
         self.scene.build_maze()
         self.walker.set_up()
         y = self.scene.maze.wall_size.y
         cam_pos = self.walker.navigate(Point3(0, y, 1))
         self.camera_controller.set_up(cam_pos)
 
-        self.aircraft_1.set_up(Corners.TOP_RIGHT)
-        self.aircraft_2.set_up(Corners.BOTTOM_LEFT)
+        self.aircrafts.set_up([Corners.TOP_RIGHT, Corners.BOTTOM_LEFT])
 
     def initialize(self):
         self.scene.destroy_maze()
         self.walker_q.clear()
         self.walker.initialize()
-        self.aircraft_1.initialize()
-        self.aircraft_2.initialize()
+        self.aircrafts.initialize()
         self.camera_controller.initialize()
 
     def start_game(self):
-        self.accept('escape', sys.exit)
+        # also when a replay applies the recorded start, in which the START button is not clicked.
+        self.screen.fade_out()
+        self.accept('escape', self.exit_game)
         self.aircrafts_state = Status.READY
         self.walker_state = Status.READY
 
+    def restart_game(self):
+        self.set_up_game()
+        self.request(Event.START)
+
     def calc_aspect_ratio(self, window_size, display_region):
         """Return aspect ratio.
             Args:
@@ -234,16 +375,18 @@ class MazeLand(ShowBase):
         rel_pos = Point3(0, -self.scene.maze.wall_size.y, 5)
 
         aircraft_regions = [
-            [self.aircraft_1, Vec4(0., 0.499, 0.75, 1)],  # left top; 0.499 = 0.5 - 0.001; to make white line.
-            [self.aircraft_2, Vec4(0.501, 1, 0.75, 1)]    # right top; 0.501 =  0.5 + 0.001; to make white line.
+            [0, Vec4(0., 0.499, 0.75, 1)],  # left top; 0.499 = 0.5 - 0.001; to make white line.
+            [1, Vec4(0.501, 1, 0.75, 1)]    # right top; 0.501 =  0.5 + 0.001; to make white line.
         ]
 
-        for aircraft, region in aircraft_regions:
-            pos = aircraft.get_relative_pos(rel_pos)
+        # the first two aircrafts are shown, if there are.
+        for i, region in aircraft_regions[:self.aircrafts.n]:
+            root_np = self.aircrafts.roots[i]
+            pos = root_np.get_relative_point(self.aircrafts.directions[i], rel_pos)
             cam = self.create_split_screen_camera(region, window_size)
             cam.set_pos(pos)
-            cam.reparent_to(aircraft.root_np)
-            cam.look_at(aircraft.body)
+            cam.reparent_to(root_np)
+            cam.look_at(self.aircrafts.bodies[i])
 
         # make split screen for walker
         region = Vec4(0, 1, 0, 0.748)  # 0.748 =0.75 - 0.002 to make white line.
@@ -273,19 +416,21 @@ class MazeLand(ShowBase):
         rel_pos = Point3(0, -self.scene.maze.wall_size.y, 5)
 
         aircraft_regions = [
-            [self.aircraft_1, Vec4(0., 0.499, 0.75, 1)],  # left top; 0.499 = 0.5 - 0.001; to make white line.
-            [self.aircraft_2, Vec4(0.501, 1, 0.75, 1)]    # right top; 0.501 = 0.5 + 0.001; to make white line.
+            Vec4(0., 0.499, 0.75, 1),  # left top; 0.499 = 0.5 - 0.001; to make white line.
+            Vec4(0.501, 1, 0.75, 1)    # right top; 0.501 = 0.5 + 0.001; to make white line.
         ]
 
-        for i, (aircraft, region) in enumerate(aircraft_regions):
+        # the first two aircrafts are shown, if there are.
+        for i, region in enumerate(aircraft_regions[:self.aircrafts.n]):
             display_region = self.win.make_display_region(region)
             cam = self.create_region_camera(f'cam_aircraft_{i}', region, window_size)
             # needs set_sort if one region overlaps another.
             # display_region.set_sort(100 + i)
             display_region.set_camera(cam)
-            cam.set_pos(aircraft.get_relative_pos(rel_pos))
-            cam.reparent_to(aircraft.root_np)
-            cam.look_at(aircraft.body)
+            root_np = self.aircrafts.roots[i]
+            cam.set_pos(root_np.get_relative_point(self.aircrafts.directions[i], rel_pos))
+            cam.reparent_to(root_np)
+            cam.look_at(self.aircrafts.bodies[i])
 
         # make region for walker
         region = Vec4(0, 1, 0, 0.748)  # 0.748 = 0.75 - 0.002; to make white line.
@@ -311,9 +456,22 @@ class MazeLand(ShowBase):
         else:
             self.debug.hide()
 
+    def measure_startup(self, task):
+        self.first_frame_time = time.perf_counter() - self.start_time
+        return task.done
+
+    def log_startup(self):
+        phases = ', '.join(f'{name} {t:.3f}' for name, t in self.startup_times.items())
+        print(f'startup (s): {phases}; first frame {self.first_frame_time or 0:.3f}, ready {self.ready_time:.3f}')
+
     def print_info(self):
-        pass
-        # print('walker_pos', self.walker_controller.walker_pos)
+        self.log_startup()
+        from maze_algorithm import BACKEND
+        print(f'maze algorithm: {BACKEND} code')
+        print(f'assets preloaded in {assets.preload_time or 0:.3f} s')
+
+        for path, load_time in sorted(assets.load_times.items(), key=lambda item: -item[1]):
+            print(f'{load_time * 1000:>9.2f} ms  {path}')
 
     def get_key_input(self):
         direction = None
@@ -331,70 +489,74 @@ class MazeLand(ShowBase):
 
         return direction
 
-    def control_walker(self, dt):
-        direction = self.get_key_input()
+    def control_walker(self, dt, direction):
         walker_pos = self.walker.update(direction, dt)
-        self.camera_controller.update(dt, walker_pos, self.walker.state)
+
+        with profiler.section('camera'):
+            self.camera_controller.update(dt, walker_pos, self.walker.state)
 
         match self.walker_state:
 
             case Status.PLAY:
-                for aircraft in [self.aircraft_1, self.aircraft_2]:
-                    if aircraft.detect_collision(self.walker.body):
-                        self.accident_aircrafts.append(aircraft)
-                        aircraft.stop = True
-
-                if self.accident_aircrafts:
+                if (accidents := self.detect_walker_collisions()).any():
+                    self.aircrafts.stop |= accidents
                     self.walker.crash()
                     self.walker_state = Status.WAIT
 
             case Status.WAIT:
-                for aircraft in self.accident_aircrafts:
-                    if not aircraft.detect_collision(self.walker.body):
-                        aircraft.stop = False
+                # the aircrafts in the accident restart when they get apart from the walker.
+                self.aircrafts.stop &= self.detect_walker_collisions()
 
-                if all(not aircraft.stop for aircraft in self.accident_aircrafts):
-                    self.accident_aircrafts.clear()
+                if not self.aircrafts.stop.any():
                     self.walker_state = Status.PLAY
 
             case Status.READY:
                 self.walker.state = Status.STOP
                 self.walker_state = Status.PLAY
 
-    def control_aircrafts(self, dt):
-        self.aircraft_1.update(dt)
-        self.aircraft_2.update(dt)
+    def detect_walker_collisions(self):
+        body = self.walker.body
+        return self.aircrafts.detect_collisions(body.get_pos(self.render), body.radius, body.half_height)
 
-        match self.aircrafts_state:
+    def control_aircrafts(self, dt):
+        if self.aircrafts.pursuit > 0:
+            space = self.scene.maze.cartesian_to_space(self.walker.root_np.get_pos().xy)
+            self.scene.maze.graph.set_target('walker', *space)
 
-            case Status.PLAY:
-                if self.aircraft_1.detect_collision(self.aircraft_2.body):
-                    ascend = False
-                    for aircraft in [self.aircraft_1, self.aircraft_2]:
-                        if aircraft.state == Status.MOVE:
-                            if not ascend:
-                                aircraft.state = Status.LIFT_UP
-                                ascend = True
-                                continue
-                    self.aircrafts_state = Status.WAIT
+        # the aircrafts avoid each other in the update.
+        self.aircrafts.update(dt)
 
-            case Status.WAIT:
-                if not self.aircraft_1.detect_collision(self.aircraft_2.body):
-                    for aircraft in [self.aircraft_1, self.aircraft_2]:
-                        if aircraft.stop:
-                            aircraft.stop = False
-                    self.aircrafts_state = Status.PLAY
+        match self.aircrafts_state:
 
             case Status.READY:
-                self.aircraft_1.start(0.5)
-                self.aircraft_2.start(1)
-
+                self.aircrafts.start([0.5 * (i % 2 + 1) for i in range(self.aircrafts.n)])
                 self.aircrafts_state = Status.PLAY
 
+    def tick(self, task):
+        """Advance the frame time by the time step given by the session.
+        """
+        if self.session.finished:
+            self.taskMgr.remove('update')
+            self.messenger.send('replay_end')
+            return task.done
+
+        dt = self.session.next_dt()
+        self.clock_time += dt
+        globalClock.set_frame_time(self.clock_time)
+        globalClock.set_dt(dt)
+        return task.cont
+
     def update(self, task):
         dt = globalClock.get_dt()
-        self.control_aircrafts(dt)
-        self.control_walker(dt)
+        direction, events = self.session.get_input(self.get_key_input(), self.events)
+        self.events = Event(0)
+        self.apply_events(events)
+
+        with profiler.section('aircrafts'):
+            self.control_aircrafts(dt)
+
+        with profiler.section('walker'):
+            self.control_walker(dt, direction)
 
         match self.state:
             case Status.INITIALIZE:
@@ -402,11 +564,14 @@ class MazeLand(ShowBase):
                 self.state = Status.READY
 
             case Status.READY:
-                self.set_up_game()
-                self.screen.fade_out(self.start_game)
-                self.state = None
+                # wait until the next maze is built in the background.
+                if self.scene.is_maze_prepared():
+                    self.request(Event.SET_UP)
+                    self.state = None
+
+        with profiler.section('physics'):
+            self.world.do_physics(dt)
 
-        self.world.do_physics(dt)
         return task.cont
 
 
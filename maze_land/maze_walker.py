@@ -8,7 +8,8 @@ from panda3d.core import NodePath, TransformState
 from panda3d.core import Vec2, Vec3, Point3, BitMask32
 from direct.interval.IntervalGlobal import ProjectileInterval, Parallel
 
-from .basic_character import Sensor, Direction, Status
+from .basic_character import Sensor, Direction, Status, FRONTS
+from .assets import assets
 
 
 class Character(NodePath):
@@ -18,7 +19,7 @@ class Character(NodePath):
         height, radius = 7.0, 1.5
         shape = BulletCapsuleShape(radius, height - 2 * radius, ZUp)
         self.node().add_shape(shape)
-        self.model = base.loader.loadModel('models/snowman/snowman')
+        self.model = assets.get_model('models/snowman/snowman')
         self.model.setTransform(TransformState.makePos(Vec3(0, 0, -3)))
         self.model.reparentTo(self)
         self.set_scale(0.2)
@@ -28,6 +29,10 @@ class Character(NodePath):
         self.node().set_ccd_swept_sphere_radius(0.5)
         self.set_collide_mask(BitMask32.bit(4))
 
+        # the capsule after scaling, for collision tests without Bullet.
+        self.radius = radius * self.get_scale().z
+        self.half_height = (height / 2 - radius) * self.get_scale().z
+
 
 class PassingPoints(NamedTuple):
 
@@ -37,12 +42,26 @@ class PassingPoints(NamedTuple):
 
 
 class MazeWalker:
-
-    def __init__(self, world, maze_builder, walker_q, orient=-1):
+    """The walker controlled by the player.
+        Args:
+            world (panda3d.bullet.BulletWorld)
+            maze_builder (MazeBuilder)
+            walker_q (collections.deque): the passing points of the walker are put in.
+            orient (int): 1 or -1; the orientation of the model.
+            grid_movement (bool): True to check the routes in the graph of the maze
+                and to cache the floor height of each space, instead of casting rays every step.
+            height_sampler (HeightSampler): if given, the heights of the ground are looked up in it
+                instead of casting rays to the terrain.
+    """
+
+    def __init__(self, world, maze_builder, walker_q, orient=-1, grid_movement=True, height_sampler=None):
         self.world = world
         self.maze = maze_builder
         self.trace_q = walker_q
         self.orient = orient
+        self.grid_movement = grid_movement
+        self.height_sampler = height_sampler
+        self.floor_heights = {}   # (row, col): z of the floor at the center of the space
 
         self.root_np = NodePath('root')
         self.direction_np = NodePath('direction')
@@ -66,9 +85,10 @@ class MazeWalker:
         self.state = None
 
     def set_up(self):
+        self.floor_heights.clear()
         xy = self.maze.top_left + Vec2(self.maze.wall_size.x, 0)
-        hit_pos = self.cast_ray_downward(Point3(xy, 0), from_delta=30, to_delta=-30)
-        z = hit_pos.z + self.body_z
+        self.space = self.next_space = tuple(self.maze.cartesian_to_space(xy))
+        z = self.get_ground_z(Point3(xy, 0), from_delta=30, to_delta=-30) + self.body_z
         self.root_np.set_pos(Point3(xy, z))
         self.direction_np.set_hpr(Vec3(0, 0, 0))
 
@@ -78,7 +98,14 @@ class MazeWalker:
             sensor.reparent_to(self.direction_np)
             yield sensor
 
-    def calc_passing_points(self, direction):
+    def get_next_space(self, direction):
+        """Return the space next to the walker in the direction; FORWARD or BACKWARD.
+        """
+        dr, dc = FRONTS[round(self.direction_np.get_h() / 90) % 4]
+        relative_direction = direction.value[1] * self.orient
+        return self.space[0] + dr * relative_direction, self.space[1] + dc * relative_direction
+
+    def calc_passing_points(self, direction, space):
         start_pt = self.root_np.get_pos()
 
         relative_direction = direction.get_direction(self.orient)
@@ -86,10 +113,10 @@ class MazeWalker:
         to_pos = forward_vector * self.moving_distance + start_pt
 
         # cannot get outside of the entrance.
-        if (hit_pos := self.cast_ray_downward(to_pos)).y > self.maze.top_left.y:
+        if to_pos.y > self.maze.top_left.y:
             return False
 
-        end_pt = hit_pos + Vec3(0, 0, self.body_z)
+        end_pt = Point3(to_pos.xy, self.get_floor_z(to_pos, space) + self.body_z)
         mid_pt = (start_pt + end_pt) / 2
         mid_pt.z += 1
 
@@ -117,7 +144,10 @@ class MazeWalker:
 
         return Point3(px, py, pz)
 
-    def check_route(self, direction):
+    def check_route(self, direction, space):
+        if self.grid_movement:
+            return self.maze.graph.is_open(*space)
+
         pos_from = self.root_np.get_pos()
 
         for sensor in self.sensors:
@@ -135,6 +165,26 @@ class MazeWalker:
 
         return None
 
+    def get_ground_z(self, pos, **kwargs):
+        """Return z of the terrain below pos. kwargs are passed to cast_ray_downward.
+        """
+        if self.height_sampler is not None:
+            return self.height_sampler.get_height(pos.x, pos.y)
+
+        return self.cast_ray_downward(pos, **kwargs).z
+
+    def get_floor_z(self, pos, space):
+        """Return z of the floor at pos, which is the center of the space.
+           With grid_movement, the floor is looked up only the first time for each space.
+        """
+        if not self.grid_movement:
+            return self.get_ground_z(pos)
+
+        if (z := self.floor_heights.get(space)) is None:
+            z = self.floor_heights[space] = self.get_ground_z(pos)
+
+        return z
+
     def turn(self, direction, dt, max_angle=90):
         rotate_direction = direction.get_direction(self.orient)
         angle = self.angular_velocity * dt
@@ -155,13 +205,12 @@ class MazeWalker:
         if self.total == 1:
             self.total = 0
             self.root_np.set_pos(self.passing_pts.end)
+            self.space = self.next_space
             return True
 
     def jump(self, dt):
         if self.acceleration <= -1 * self.max_acceleration:
-            hit_pos = self.cast_ray_downward(self.root_np.get_pos())
-            landing_pos = hit_pos + Vec3(0, 0, self.body_z)
-            self.root_np.set_z(landing_pos.z)
+            self.root_np.set_z(self.get_floor_z(self.root_np.get_pos(), self.space) + self.body_z)
             return True
 
         next_z = self.acceleration * dt
@@ -172,10 +221,13 @@ class MazeWalker:
         match direction:
 
             case Direction.FORWARD | Direction.BACKWARD:
-                if not self.check_route(direction) or \
-                        not self.calc_passing_points(direction):
+                space = self.get_next_space(direction)
+
+                if not self.check_route(direction, space) or \
+                        not self.calc_passing_points(direction, space):
                     return None
 
+                self.next_space = space
                 self.trace_q.append(self.passing_pts)
                 return Status.MOVE
 
@@ -230,9 +282,8 @@ class MazeWalker:
     def crash(self):
         if self.state != Status.CRASH:
             current_pos = self.root_np.get_pos()
-            hit_pos = self.cast_ray_downward(current_pos)
             self.projectile_seq = ProjectileSequence(
-                self.root_np, self.direction_np, current_pos, hit_pos.z)
+                self.root_np, self.direction_np, current_pos, self.get_ground_z(current_pos))
             self.projectile_seq.start()
             self.state = Status.CRASH
 
@@ -0,0 +1,238 @@
+import functools
+import json
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+
+import numpy as np
+from direct.gui.OnscreenText import OnscreenText
+from panda3d.core import TextNode, LColor
+
+
+class Section:
+    """Context manager which adds the time spent in it to the current frame of the profiler.
+    """
+
+    def __init__(self, profiler, index):
+        self.profiler = profiler
+        self.index = index
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.index, self.start, time.perf_counter() - self.start)
+
+
+class Span:
+    """Context manager which records a span not repeated every frame; e.g. building a maze.
+    """
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profiler.spans.append(
+            (self.name, self.start, time.perf_counter() - self.start, threading.get_ident()))
+
+
+class Profiler:
+    """Timings of the sections of the last frames in a ring buffer, and of the spans like building a maze.
+       Nothing is measured while disabled; section() and span() only return a shared null context.
+        Args:
+            size (int): the number of frames kept in the ring buffer.
+            max_spans (int): the number of spans kept.
+    """
+
+    sections = ('aircrafts', 'walker', 'camera', 'physics', 'render')
+
+    def __init__(self, size=600, max_spans=1000):
+        self.enabled = False
+        self.index = {name: i for i, name in enumerate(self.sections)}
+        self.contexts = {name: Section(self, i) for name, i in self.index.items()}
+        self.render = self.contexts['render']
+        self.null = nullcontext()
+
+        self.spans = deque(maxlen=max_spans)
+        self.origin = time.perf_counter()
+        self.allocate(size)
+
+    def allocate(self, size):
+        """Make the ring buffer of the size, in which nothing is recorded yet.
+        """
+        self.size = size
+        self.frame_starts = np.zeros(size)
+        self.frame_times = np.zeros(size)
+        self.starts = np.full((size, len(self.sections)), np.nan)
+        self.times = np.zeros((size, len(self.sections)))
+        self.frame = -1
+
+    def enable(self, enabled=True):
+        if enabled and not self.enabled:
+            self.frame = -1
+        self.enabled = enabled
+
+    def section(self, name):
+        return self.contexts[name] if self.enabled else self.null
+
+    def span(self, name):
+        return Span(self, name) if self.enabled else self.null
+
+    def profile(self, name):
+        """Decorator which records every call of the function as a span.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+
+        return decorator
+
+    def record(self, i, start, elapsed):
+        if self.frame < 0:
+            return
+
+        row = self.frame % self.size
+
+        if np.isnan(self.starts[row, i]):
+            self.starts[row, i] = start
+        self.times[row, i] += elapsed
+
+    def begin_frame(self, task):
+        if self.enabled:
+            now = time.perf_counter()
+
+            if self.frame >= 0:
+                row = self.frame % self.size
+                self.frame_times[row] = now - self.frame_starts[row]
+
+            self.frame += 1
+            row = self.frame % self.size
+            self.frame_starts[row] = now
+            self.starts[row] = np.nan
+            self.times[row] = 0
+
+        return task.cont
+
+    def begin_render(self, task):
+        if self.enabled:
+            self.render.__enter__()
+        return task.cont
+
+    def end_render(self, task):
+        if self.enabled:
+            self.render.__exit__()
+        return task.cont
+
+    def add_tasks(self, task_mgr):
+        """Mark the start of each frame and the rendering in igLoop, whose sort is 50.
+        """
+        task_mgr.add(self.begin_frame, 'profile_frame', sort=-200)
+        task_mgr.add(self.begin_render, 'profile_render_begin', sort=49)
+        task_mgr.add(self.end_render, 'profile_render_end', sort=51)
+
+    def get_rows(self, frames=None):
+        """Return the rows of the finished frames in the ring buffer from the oldest.
+        """
+        count = min(self.frame, self.size - 1)
+
+        if frames is not None:
+            count = min(count, frames)
+
+        return np.arange(self.frame - count, self.frame) % self.size
+
+    def get_stats(self, frames=60):
+        """Return {name: (mean, max)} of the times in milliseconds over the last frames.
+        """
+        rows = self.get_rows(frames)
+
+        if not len(rows):
+            return {}
+
+        stats = {'frame': (self.frame_times[rows].mean() * 1000, self.frame_times[rows].max() * 1000)}
+
+        for name, i in self.index.items():
+            times = self.times[rows, i]
+            stats[name] = (times.mean() * 1000, times.max() * 1000)
+
+        return stats
+
+    def to_chrome_trace(self):
+        """Return the frames in the ring buffer and the spans as Trace Event Format,
+           which can be opened in chrome://tracing or Perfetto.
+        """
+        main_thread = threading.main_thread().ident
+        events = []
+
+        def _add(name, start, elapsed, tid=main_thread, **args):
+            events.append({
+                'name': name, 'ph': 'X', 'pid': 0, 'tid': tid,
+                'ts': (start - self.origin) * 1e6, 'dur': elapsed * 1e6, 'args': args
+            })
+
+        for row in self.get_rows():
+            _add('frame', self.frame_starts[row], self.frame_times[row])
+
+            for name, i in self.index.items():
+                if not np.isnan(start := self.starts[row, i]):
+                    _add(name, start, self.times[row, i])
+
+        for name, start, elapsed, tid in self.spans:
+            _add(name, start, elapsed, tid)
+
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def dump(self, file_path):
+        with open(file_path, 'w') as f:
+            json.dump(self.to_chrome_trace(), f)
+
+
+# the profiler shared by the modules of the game.
+profiler = Profiler()
+
+
+class ProfileOverlay(OnscreenText):
+    """On-screen text of the mean and max times of the sections over the last frames.
+        Args:
+            profiler (Profiler)
+            interval (int): the text is updated every this number of frames.
+    """
+
+    def __init__(self, profiler, interval=15):
+        super().__init__(
+            parent=base.a2dTopLeft,
+            pos=(0.05, -0.08),
+            scale=0.045,
+            fg=LColor(1, 1, 0, 1),
+            bg=LColor(0, 0, 0, 0.6),
+            align=TextNode.A_left,
+            mayChange=True
+        )
+        self.profiler = profiler
+        self.interval = interval
+        self.hide()
+
+    def toggle(self):
+        if self.is_hidden():
+            self.profiler.enable()
+            self.show()
+            base.taskMgr.add(self.refresh, 'profile_overlay', sort=52)
+        else:
+            self.profiler.enable(False)
+            self.hide()
+            base.taskMgr.remove('profile_overlay')
+
+    def refresh(self, task):
+        if self.profiler.frame % self.interval == 0 and (stats := self.profiler.get_stats()):
+            frame_time, _ = stats['frame']
+            lines = [f'{name:<10}{mean:7.2f}{peak:7.2f}' for name, (mean, peak) in stats.items()]
+            self.setText('\n'.join([f'{1000 / frame_time:.0f} fps   mean    max (ms)', *lines]))
+
+        return task.cont
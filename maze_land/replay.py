@@ -0,0 +1,142 @@
+import os
+import struct
+import time
+from enum import IntFlag, auto
+
+import numpy as np
+
+from .basic_character import Direction
+
+
+class Event(IntFlag):
+    """Changes of the game flow, which are applied at the start of the next frame,
+       so that they happen in the same frame in playback.
+    """
+
+    START = auto()        # start the walker and the aircrafts.
+    STOP = auto()         # stop them after a round finished.
+    INITIALIZE = auto()   # destroy the maze to build the next one.
+    SET_UP = auto()       # set up the next maze, the walker and the aircrafts.
+
+
+def get_backend():
+    """Return the implementation of the maze algorithm, which is imported
+       when a replay is made or played, not when the game starts.
+    """
+    from maze_algorithm import BACKEND
+    return BACKEND
+
+
+class Replay:
+    """The seed and the inputs of every frame of a game session, from which the session is re-run.
+       The file has a header of the magic, the version, the implementation of the maze algorithm and the seed,
+       followed by 6 bytes for each frame: dt as float32, the index of the input direction and the events.
+       The implementation is recorded because the same seed makes different mazes in pymaze and cymaze.
+        Args:
+            seed (int): the seed of the session.
+            frames (numpy.ndarray): the frames; structured array of frame_dtype.
+            backend (str): an item of backends; the implementation in use if not given.
+    """
+
+    magic = b'MZRP'
+    version = 2
+    header = struct.Struct('<4sHBQ')
+    backends = ('python', 'cython')
+    frame = struct.Struct('<fBB')
+    frame_dtype = np.dtype([('dt', '<f4'), ('input', 'u1'), ('events', 'u1')])
+    # index 0 is no input.
+    inputs = [None, *Direction]
+
+    def __init__(self, seed, frames=None, backend=None):
+        self.seed = seed
+        self.frames = np.zeros(0, dtype=self.frame_dtype) if frames is None else frames
+        self.backend = get_backend() if backend is None else backend
+
+    def __len__(self):
+        return len(self.frames)
+
+    def save(self, file_path):
+        with open(file_path, 'wb') as f:
+            f.write(self.header.pack(self.magic, self.version, self.backends.index(self.backend), self.seed))
+            f.write(self.frames.tobytes())
+
+    @classmethod
+    def load(cls, file_path):
+        with open(file_path, 'rb') as f:
+            data = f.read()
+
+        magic, version, backend, seed = cls.header.unpack_from(data)
+
+        if magic != cls.magic or version != cls.version:
+            raise ValueError(f'{file_path} is not a replay of version {cls.version}.')
+
+        frames = np.frombuffer(data, dtype=cls.frame_dtype, offset=cls.header.size).copy()
+        return cls(seed, frames, cls.backends[backend])
+
+
+class ReplayRecorder:
+    """Record the time step and the inputs of every frame.
+       The time steps are rounded to float32 before the game uses them,
+       so that the recorded session is re-run with exactly the same values.
+        Args:
+            seed (int): the seed of the session; random if not given.
+            dt (float): the fixed time step; if None, the real time between frames.
+    """
+
+    def __init__(self, seed=None, dt=None):
+        self.seed = int.from_bytes(os.urandom(8), 'little') if seed is None else seed
+        self.dt = dt
+        self.frames = bytearray()
+        self.last_time = None
+        self.frame_dt = 0.0
+        self.finished = False
+
+    def next_dt(self):
+        now = time.perf_counter()
+
+        if self.dt is not None:
+            dt = self.dt
+        else:
+            dt = 0 if self.last_time is None else now - self.last_time
+
+        self.last_time = now
+        self.frame_dt = float(np.float32(dt))
+        return self.frame_dt
+
+    def get_input(self, direction, events):
+        self.frames += Replay.frame.pack(self.frame_dt, Replay.inputs.index(direction), events)
+        return direction, events
+
+    def get_replay(self):
+        return Replay(self.seed, np.frombuffer(bytes(self.frames), dtype=Replay.frame_dtype))
+
+
+class ReplayPlayer:
+    """Give the time step and the inputs of every frame from a Replay, instead of the live ones.
+        Args:
+            replay (Replay)
+    """
+
+    def __init__(self, replay):
+        if replay.backend != (backend := get_backend()):
+            raise ValueError(f'The replay was recorded with the {replay.backend} maze algorithm, '
+                             f'which makes different mazes from the {backend} one in use.')
+
+        self.replay = replay
+        self.seed = replay.seed
+        self.dts = replay.frames['dt'].astype(np.float64).tolist()
+        self.inputs = [Replay.inputs[i] for i in replay.frames['input'].tolist()]
+        self.events = [Event(e) for e in replay.frames['events'].tolist()]
+        self.frame = 0
+
+    @property
+    def finished(self):
+        return self.frame >= len(self.dts)
+
+    def next_dt(self):
+        return self.dts[self.frame]
+
+    def get_input(self, direction, events):
+        i = self.frame
+        self.frame += 1
+        return self.inputs[i], self.events[i]
@@ -1,3 +1,6 @@
+from enum import Enum, auto
+
+import numpy as np
 from panda3d.bullet import BulletRigidBodyNode, BulletSoftBodyNode
 from panda3d.bullet import BulletConvexHullShape, BulletHeightfieldShape, ZUp
 from panda3d.bullet import BulletHelper
@@ -6,19 +9,22 @@ from panda3d.core import Vec3, Point3, BitMask32, LColor
 from panda3d.core import Filename, PNMImage
 from panda3d.core import Shader
 from panda3d.core import TextureStage, TransformState
-from panda3d.core import GeoMipTerrain
 from panda3d.core import GeomNode, GeomVertexFormat
 
 from shapes import Cylinder
-from .maze3D import MazeBuilder
+from .maze3D import MazeBuilder, RenderMode, PhysicsMode
 from .lights import BasicAmbientLight, BasicDayLight
+from .heightfield import HeightSampler, read_heightfield, get_center_area, make_heightfield_shape
+from .terrain import load_terrain_mesh
+from .profiler import profiler
+from .assets import assets
 
 
 class Sky(NodePath):
 
     def __init__(self):
         super().__init__(PandaNode('sky'))
-        model = base.loader.load_model('models/blue-sky/blue-sky-sphere')
+        model = assets.get_model('models/blue-sky/blue-sky-sphere')
         model.set_color(LColor(2, 2, 2, 1))
         model.set_scale(0.2)
         model.set_z(0)
@@ -26,12 +32,30 @@ class Sky(NodePath):
         self.set_shader_off()
 
 
-class Terrain(NodePath):
+class TerrainCollision(Enum):
 
-    def __init__(self):
+    FULL = auto()      # the whole heightfield at full resolution.
+    COMPACT = auto()   # full resolution around the maze, and decimated around it.
+    CENTER = auto()    # only around the maze, at full resolution.
+
+
+class Terrain(NodePath):
+    """Args:
+            collision (TerrainCollision): the collision shapes made from the heightfield.
+            radius (float): the half width of the area around the maze; for COMPACT and CENTER.
+                            Scene widens it with fit when a maze does not fit in it.
+            step (int): the interval of the pixels of the decimated area; for COMPACT.
+    """
+
+    def __init__(self, collision=TerrainCollision.COMPACT, radius=32, step=4):
         super().__init__(BulletRigidBodyNode('terrain'))
         self.file_path = 'terrains/heightfield.png'
         self.heigt = 30
+        self.collision = collision
+        self.radius = radius
+        self.step = step
+        self.bodies = [self.node()]
+        self.surroundings = None
 
         self.set_pos(Point3(0, 0, 0))
         self.node().set_mass(0)
@@ -44,30 +68,75 @@ class Terrain(NodePath):
             'textures/grass_03.jpg',
         ]
         self.add_shape_to_terrain()
-        self.make_geomip_terrain()
+        self.height_sampler = HeightSampler(self.file_path, self.heigt, self.get_pos())
+        self.make_terrain_mesh()
         self.setup_shader()
         self.setup_textures(textures)
 
     def add_shape_to_terrain(self):
-        img = PNMImage(Filename(self.file_path))
-        shape = BulletHeightfieldShape(img, self.heigt, ZUp)
-        shape.set_use_diamond_subdivision(True)
-        self.node().add_shape(shape)
+        if self.collision == TerrainCollision.FULL:
+            img = PNMImage(Filename(self.file_path))
+            shape = BulletHeightfieldShape(img, self.heigt, ZUp)
+            shape.set_use_diamond_subdivision(True)
+            self.node().add_shape(shape)
+            return
+
+        brights = read_heightfield(self.file_path)
+        rows, cols = brights.shape
+        r0, r1, c0, c1 = get_center_area(rows, cols, self.radius, self.step)
+        shape, pos = make_heightfield_shape(brights, self.heigt, r0, r1, c0, c1)
+        self.node().add_shape(shape, TransformState.make_pos(pos))
+
+        if self.collision == TerrainCollision.COMPACT:
+            self.add_surroundings(brights, r0, r1, c0, c1)
+
+    def add_surroundings(self, brights, r0, r1, c0, c1):
+        """Add the decimated heightfields of the four sides of the area (r0, r1, c0, c1) to another body,
+           which is scaled by step in x and y, because the scale of a shape is taken from its node.
+        """
+        body = NodePath(BulletRigidBodyNode('terrain_surroundings'))
+        body.node().set_mass(0)
+        body.set_collide_mask(BitMask32.bit(1))
+        body.set_scale(Vec3(self.step, self.step, 1))
+        body.reparent_to(self)
+        self.bodies.append(body.node())
+        self.surroundings = body
+
+        rows, cols = brights.shape
+        sides = [
+            (0, r0, 0, cols - 1),          # south
+            (r1, rows - 1, 0, cols - 1),   # north
+            (r0, r1, 0, c0),               # west
+            (r0, r1, c1, cols - 1),        # east
+        ]
 
-    def make_geomip_terrain(self):
-        self.terrain = GeoMipTerrain('geomip_terrain')
-        self.terrain.set_heightfield(self.file_path)
-        self.terrain.set_border_stitching(True)
+        for area in sides:
+            # no side if the area reaches the edge of the heightfield.
+            if area[0] < area[1] and area[2] < area[3]:
+                shape, pos = make_heightfield_shape(brights, self.heigt, *area, self.step)
+                body.node().add_shape(shape, TransformState.make_pos(pos))
 
-        self.terrain.set_block_size(8)
-        self.terrain.set_min_level(2)
-        self.terrain.set_focal_point(base.camera)
+    def fit(self, radius):
+        """Make the collision shapes again with the area around the maze widened to the radius.
+           The bodies must be removed from the Bullet world before this is called.
+        """
+        self.radius = radius
 
+        for shape in self.node().get_shapes():
+            self.node().remove_shape(shape)
+
+        if self.surroundings is not None:
+            self.surroundings.remove_node()
+            self.surroundings = None
+
+        self.bodies = [self.node()]
+        self.add_shape_to_terrain()
+
+    def make_terrain_mesh(self):
         pos = Point3(-128, -128, -(self.heigt / 2))
-        self.root = self.terrain.get_root()
+        self.root = load_terrain_mesh(self.file_path)
         self.root.set_scale(Vec3(1, 1, self.heigt))
         self.root.set_pos(pos)
-        self.terrain.generate()
         self.root.reparent_to(self)
 
     def setup_shader(self):
@@ -85,7 +154,7 @@ class Terrain(NodePath):
             ts = TextureStage(f'ts{i}')
             ts.set_sort(i)
             self.root.set_shader_input(f'tex_ScaleFactor{i}', 10)  # 10 is texture scale
-            tex = base.loader.load_texture(img_file)
+            tex = assets.get_texture(img_file)
             self.root.set_texture(ts, tex)
 
 
@@ -109,7 +178,7 @@ class Cloth(NodePath):
         vis_nd.add_geom(geom)
         vis_np = self.attach_new_node(vis_nd)
         vis_np.reparent_to(self)
-        vis_np.set_texture(base.loader.load_texture('textures/finish.png'))
+        vis_np.set_texture(assets.get_texture('textures/finish.png'))
         BulletHelper.make_texcoords_for_patch(geom, resx, resy)
 
 
@@ -155,7 +224,7 @@ class GoalGate(NodePath):
 
     def create_poles(self):
         self.poles = Poles(self.gate_w, self.pole_h)
-        tex = base.loader.load_texture('textures/concrete2.jpg')
+        tex = assets.get_texture('textures/concrete2.jpg')
         self.poles.set_texture(tex)
         self.poles.reparent_to(self)
         self.world.attach(self.poles.node())
@@ -187,9 +256,20 @@ class GoalGate(NodePath):
 
 
 class Scene:
-
-    def __init__(self, world):
+    """Args:
+            world (panda3d.bullet.BulletWorld)
+            seed (int): seed for the seeds of the mazes; the same seed always builds the same mazes in order.
+            threaded (bool): if False, the next maze is built in the main thread; e.g. for playback.
+            levels (maze_algorithm.cache.MazeCache): if given, the mazes are chosen from it when it has mazes
+                of the size; a session is played back with the same levels.
+            terrain_collision (TerrainCollision): the collision shapes of the terrain.
+    """
+
+    def __init__(self, world, seed=None, threaded=True, levels=None, terrain_collision=TerrainCollision.COMPACT):
         self.world = world
+        self.threaded = threaded
+        self.levels = levels
+        self.rng = np.random.default_rng(seed)
 
         self.ambient_light = BasicAmbientLight()
         self.day_light = BasicDayLight()
@@ -200,22 +280,104 @@ class Scene:
         self.sky = Sky()
         self.sky.reparent_to(self.scene)
 
-        self.terrain = Terrain()
+        self.terrain = Terrain(terrain_collision)
         self.terrain.reparent_to(self.scene)
-        self.world.attach(self.terrain.node())
 
-        self.maze = MazeBuilder(self.world, self.scene)
+        for body in self.terrain.bodies:
+            self.world.attach(body)
+
+        self.maze = MazeBuilder(self.world, self.scene, RenderMode.MESH, PhysicsMode.COMPOUND, levels=levels)
         gate_w = self.maze.wall_size.x * 2
         self.goal_gate = GoalGate(self.world, gate_w=gate_w)
         self.goal_gate.reparent_to(self.scene)
 
+        self.next_maze = None
+        self.preparing = False
+        self.prepare_error = None
+        # the space around the maze which the walker and the goal gate can reach.
+        self.terrain_margin = 4 * self.maze.wall_size.x
+        base.taskMgr.setupTaskChain('maze_builder', numThreads=1)
+
+    def prepare_maze(self, rows=21, cols=21):
+        """Build the next maze in a thread, so that the main thread
+           only has to attach it in build_maze.
+        """
+        def _prepare(task):
+            try:
+                self.next_maze = self.maze.prepare(rows, cols, seed)
+            except Exception as e:
+                # raised again in the main thread by is_maze_prepared or build_maze.
+                self.prepare_error = e
+            finally:
+                self.preparing = False
+
+            return task.done
+
+        if self.preparing or self.next_maze is not None:
+            return
+
+        # the seed is drawn in the main thread, so that the mazes come in the same order.
+        seed = self.next_seed(rows, cols)
+        self.fit_terrain(rows, cols)
+
+        if not self.threaded:
+            self.next_maze = self.maze.prepare(rows, cols, seed)
+            return
+
+        self.preparing = True
+        base.taskMgr.add(_prepare, 'prepare_maze', taskChain='maze_builder')
+
+    def fit_terrain(self, rows, cols):
+        """Widen the area of the terrain collision at full resolution if a maze of the size does not fit in it.
+        """
+        if self.terrain.collision == TerrainCollision.FULL:
+            return
+
+        if (radius := self.maze.get_radius(rows, cols) + self.terrain_margin) <= self.terrain.radius:
+            return
+
+        for body in self.terrain.bodies:
+            self.world.remove(body)
+
+        self.terrain.fit(radius)
+
+        for body in self.terrain.bodies:
+            self.world.attach(body)
+
+    def is_maze_prepared(self):
+        self.raise_prepare_error()
+        return not self.preparing
+
+    def raise_prepare_error(self):
+        """Raise the exception which was raised while the next maze was built in the thread.
+        """
+        if (error := self.prepare_error) is not None:
+            self.prepare_error = None
+            raise error
+
+    def next_seed(self, rows, cols):
+        if self.levels is not None and len(seeds := self.levels.get_seeds(rows, cols)):
+            return int(seeds[self.rng.integers(len(seeds))])
+
+        return int(self.rng.integers(2 ** 63))
+
+    @profiler.profile('Scene.build_maze')
     def build_maze(self, rows=21, cols=21):
-        self.maze.setup(rows, cols)
+        self.raise_prepare_error()
+        self.fit_terrain(rows, cols)
+
+        if self.next_maze is None:
+            self.maze.setup(rows, cols, self.next_seed(rows, cols))
+        else:
+            self.maze.attach(self.next_maze)
+            self.next_maze = None
+
         # make goal gate.
         xy = self.maze.get_exit()
         gate_pos = Point3(xy, self.maze.get_maze_pos().z + 2)
         self.goal_gate.setup(gate_pos)
 
+    @profiler.profile('Scene.destroy_maze')
     def destroy_maze(self):
         self.maze.destroy()
         self.goal_gate.destroy()
@@ -77,6 +77,14 @@ class Button(DirectButton):
             return
         self.blur()
 
+    def enable(self, enabled=True):
+        self['state'] = DGG.NORMAL if enabled else DGG.DISABLED
+
+        if enabled:
+            self.focus()
+        else:
+            self.blur()
+
     def focus(self):
         self.is_focus = True
         self.colorScaleInterval(0.05, self.focus_color, blendType='easeInOut').start()
@@ -102,11 +110,10 @@ class Screen:
         self.background.set_transparency(1)
         self.background.set_color(self.color_in)
 
-    def fade_out(self, callback, *args, **kwargs):
+    def fade_out(self):
         Sequence(
             Func(self.frame.display, False),
-            Func(self.background.detach_node),
-            Func(callback, *args, **kwargs)
+            Func(self.background.detach_node)
         ).start()
 
     def fade_in(self, callback, *args, **kwargs):
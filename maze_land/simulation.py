@@ -0,0 +1,159 @@
+from typing import NamedTuple
+
+import numpy as np
+from panda3d.core import load_prc_file_data, NodePath
+from direct.showbase.ShowBaseGlobal import globalClock
+
+from .maze_land import MazeLand, CameraController
+from .basic_character import Direction, Status
+from .replay import Event, ReplayRecorder, ReplayPlayer
+
+
+class RoundResult(NamedTuple):
+
+    escaped: bool    # True if the walker got out of the maze first.
+    frames: int
+    sim_time: float
+
+
+class ExitSeeker:
+    """Scripted input which leads the walker to the exit along the shortest route.
+       Args:
+            error_rate (float): the probability of a random input instead of the right one.
+            seed (int): seed for the random inputs.
+    """
+
+    inputs = [
+        Direction.FORWARD, Direction.BACKWARD, Direction.LEFTWARD, Direction.RIGHTWARD, Direction.UPWARD
+    ]
+
+    def __init__(self, error_rate=0, seed=None):
+        self.error_rate = error_rate
+        self.rng = np.random.default_rng(seed)
+
+    def get_distance(self, walker, space):
+        maze = walker.maze
+
+        # the outside of the maze next to the exit.
+        if not maze.graph.is_inside(*space):
+            return -1 if walker.space == maze.exit else np.inf
+
+        return maze.graph.distance('exit', *space)
+
+    def __call__(self, walker):
+        if walker.state != Status.STOP:
+            return None
+
+        if self.error_rate and self.rng.random() < self.error_rate:
+            return self.inputs[self.rng.integers(len(self.inputs))]
+
+        walker.maze.graph.set_target('exit', *walker.maze.exit)
+        current = self.get_distance(walker, walker.space)
+
+        for direction in [Direction.FORWARD, Direction.BACKWARD]:
+            if self.get_distance(walker, walker.get_next_space(direction)) < current:
+                return direction
+
+        # the route goes to the left or right.
+        return Direction.LEFTWARD
+
+
+class HeadlessMazeLand(MazeLand):
+    """MazeLand without a window and GUI for fast-forward runs; e.g. balancing and regression tests.
+       The game loop is stepped with a fixed time step as fast as the CPU allows,
+       and the walker is controlled by a script instead of the keyboard.
+       A new round starts as soon as the last one finishes.
+       If a replay is given, the recorded session, whether rendered or headless, is played back instead.
+        Args:
+            script (callable): called with MazeWalker every step; returns Direction or None.
+                               ExitSeeker if not given.
+            dt (float): the time step in seconds.
+            max_frames (int): the round is given up after the frames; None for no limit.
+            seed (int): the seed of the session; random if not given.
+            replay (Replay): the session to be played back.
+            record_path (str): the file to which the session is saved at the end of each round.
+            levels (maze_algorithm.cache.MazeCache): pre-generated mazes from which the mazes are chosen.
+    """
+
+    threaded_maze = False
+    staged_startup = False
+
+    def __init__(self, script=None, dt=1 / 60, max_frames=None, seed=None, replay=None,
+                 record_path=None, levels=None):
+        load_prc_file_data('', 'window-type none\naudio-library-name null')
+        self.script = ExitSeeker() if script is None else script
+        self.dt = dt
+        self.max_frames = max_frames
+        self.results = []
+        self.frames = 0
+        self.start_frame = 0
+        # the sum of the time steps since the round started; they vary in a replay of the rendered game.
+        self.round_time = 0
+        self.round_over = False
+
+        session = ReplayRecorder(seed, dt) if replay is None else ReplayPlayer(replay)
+        super().__init__(session, record_path, levels)
+        self.ignore('replay_end')
+        self.request(Event.START)
+
+    def create_gui(self):
+        pass
+
+    def split_screen(self):
+        # the camera is not rendered, but still follows the walker like in the game.
+        self.camera_controller = CameraController(NodePath('camera'), self.walker_q, self.floater)
+
+    def get_key_input(self):
+        return self.script(self.walker)
+
+    def start_game(self):
+        # without the screen to fade out.
+        self.accept('escape', self.exit_game)
+        self.aircrafts_state = Status.READY
+        self.walker_state = Status.READY
+        self.start_frame = self.frames
+        self.round_time = 0
+        self.round_over = False
+
+    def finish(self):
+        # both of the walker and an aircraft can finish in the same round.
+        if self.round_over:
+            return
+
+        self.round_over = True
+        frames = self.frames - self.start_frame
+        escaped = bool(self.scene.maze.is_outside(self.walker.root_np.get_pos().xy))
+        self.results.append(RoundResult(escaped, frames, self.round_time))
+
+        # the same as the game, except that the next round starts without the screen.
+        self.save_replay()
+        self.scene.prepare_maze()
+        self.request(Event.STOP | Event.INITIALIZE)
+
+    def update(self, task):
+        self.frames += 1
+        self.round_time += globalClock.get_dt()
+
+        if self.max_frames is not None and not self.round_over:
+            if self.frames - self.start_frame > self.max_frames:
+                self.finish()
+
+        return super().update(task)
+
+    def simulate(self, rounds=1):
+        """Step the game loop until the rounds finish, and return the list of RoundResult of them.
+        """
+        total = len(self.results) + rounds
+
+        while len(self.results) < total and not self.session.finished:
+            self.task_mgr.step()
+
+        return self.results[-rounds:]
+
+    def play(self):
+        """Step the game loop until the end of the replay, and return the list of RoundResult.
+        """
+        while not self.session.finished:
+            self.task_mgr.step()
+
+        return self.results
@@ -0,0 +1,83 @@
+import numpy as np
+
+
+class SpatialHash:
+    """Uniform grid of the maze spaces, which finds the agents near each other without testing every pair.
+       The agents are sorted by the flat index of the space where they are,
+       so that the agents in a space are found by binary search.
+       Only the agents in the same or neighboring spaces are candidates,
+       so the distance for a collision must not be longer than the size of a space.
+       Args:
+            rows (int): the number of rows of the maze.
+            cols (int): the number of columns of the maze.
+    """
+
+    def __init__(self, rows, cols):
+        # the agents out of the maze are put in the spaces around it,
+        # and the grid is padded again, so that the flat index of a neighbor never wraps around to the next row.
+        self.rows, self.cols = rows, cols
+        self.width = cols + 4
+
+        # offsets of the space itself and the neighbors after it in the flat grid;
+        # the neighbors before it find the pairs the other way round.
+        self.forward_offsets = (0, 1, self.width - 1, self.width, self.width + 1)
+        self.offsets = tuple(sorted({-d for d in self.forward_offsets} | set(self.forward_offsets)))
+        self.update(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+    def to_flat(self, rows, cols):
+        rows = np.clip(rows, -1, self.rows)
+        cols = np.clip(cols, -1, self.cols)
+        return (rows + 2) * self.width + cols + 2
+
+    def update(self, rows, cols, indices=None):
+        """Put the agents into the spaces.
+            Args:
+                rows (numpy.ndarray): the rows of the spaces where the agents are.
+                cols (numpy.ndarray): the columns of the spaces where the agents are.
+                indices (numpy.ndarray): the indices of the agents; 0, 1, 2, ... if not given.
+        """
+        keys = self.to_flat(rows, cols)
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.indices = order if indices is None else np.asarray(indices)[order]
+
+    def get_ranges(self, keys):
+        """Return the start and the end positions of the agents in the spaces of the keys.
+        """
+        return np.searchsorted(self.keys, keys, 'left'), np.searchsorted(self.keys, keys, 'right')
+
+    def get_pairs(self):
+        """Return two arrays of the indices of the agents in the same or neighboring spaces;
+           each pair is found only once.
+        """
+        n = len(self.keys)
+        firsts, seconds = [], []
+
+        for offset in self.forward_offsets:
+            starts, ends = self.get_ranges(self.keys + offset)
+
+            if offset == 0:
+                # the agents after itself in the same space.
+                starts = np.arange(1, n + 1)
+
+            counts = (ends - starts).clip(0)
+
+            if not (total := counts.sum()):
+                continue
+
+            firsts.append(np.repeat(np.arange(n), counts))
+            # the positions from starts to ends for each agent.
+            steps = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            seconds.append(np.repeat(starts, counts) + steps)
+
+        if not firsts:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+
+        return self.indices[np.concatenate(firsts)], self.indices[np.concatenate(seconds)]
+
+    def get_neighbors(self, row, col):
+        """Return the indices of the agents in the space (row, col) and its neighbors.
+        """
+        starts, ends = self.get_ranges(self.to_flat(row, col) + np.array(self.offsets))
+        return np.concatenate([self.indices[start:end] for start, end in zip(starts.tolist(), ends.tolist())])
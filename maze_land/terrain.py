@@ -0,0 +1,172 @@
+"""Chunked meshes of the terrain with levels of detail, made from the heightfield image
+   and cached as a bam file, which is loaded instead of generating the meshes at startup.
+"""
+import hashlib
+import os
+import re
+
+import numpy as np
+from panda3d.core import NodePath, GeomNode, LODNode, Point3, Filename
+
+from .heightfield import read_heightfield
+from .wall_mesh import ChunkTree, make_geom
+from .bundle import ROOT
+
+
+def grid_indices(rows, cols):
+    """Return the indices of the triangles on a grid of rows x cols vertices,
+       counterclockwise seen from above; the vertices are in row-major order and y increases with the row.
+    """
+    r, c = np.meshgrid(np.arange(rows - 1), np.arange(cols - 1), indexing='ij')
+    i00 = (r * cols + c).ravel()
+    i10, i01 = i00 + 1, i00 + cols
+    i11 = i01 + 1
+    return np.stack([i00, i10, i11, i00, i11, i01], axis=1).ravel().astype(np.uint32)
+
+
+def sample(start, stop, step):
+    """Return the vertex positions from start to stop every step, always including stop.
+    """
+    return np.append(np.arange(start, stop, step), stop)
+
+
+class TerrainMesh(ChunkTree):
+    """Meshes of a heightfield in square chunks, each of which has levels of detail made by
+       skipping vertices. A camera picks the level of each chunk by its distance to the chunk
+       in the cull traversal, so that every camera of the split screen gets its own levels.
+       Like GeoMipTerrain, x and y are the pixels of the image, z is the brightness from 0 to 1,
+       and the texture coordinates range from 0 to 1 over the whole terrain.
+        Args:
+            name (str)
+            brights (numpy.ndarray): brightness of the heightfield image; returned by read_heightfield.
+            chunk_size (int): the number of cells along a side of a chunk.
+            steps (tuple of int): the intervals of the vertices of the levels, from the nearest.
+            distances (tuple of float): the distances from the camera to the center of a chunk
+                                        at which the levels switch to the next; one less than steps.
+            skirt (float): the depth of the skirts along the edges of the chunks,
+                           which hide the cracks between the chunks of different levels.
+    """
+
+    version = 1
+    far = 1e6
+
+    def __init__(self, name, brights, chunk_size=32, steps=(4, 8, 16, 32), distances=(64, 128, 192), skirt=0.05):
+        super().__init__(name)
+        self.brights = np.asarray(brights, dtype=np.float32)
+        self.skirt = skirt
+        rows, cols = self.brights.shape
+        self.normals = self.get_normals()
+
+        # the farthest level is drawn at any distance within the terrain and beyond.
+        ranges = [0, *distances, self.far]
+
+        for r in range(0, rows - 1, chunk_size):
+            for c in range(0, cols - 1, chunk_size):
+                r1, c1 = min(r + chunk_size, rows - 1), min(c + chunk_size, cols - 1)
+                area = self.brights[r:r1 + 1, c:c1 + 1]
+                center = Point3((c + c1) / 2, (r + r1) / 2, (area.min() + area.max()) / 2)
+                lod = LODNode(f'{name}_{r}_{c}')
+                lod.set_center(center)
+                chunk = NodePath(lod)
+
+                for i, step in enumerate(steps):
+                    node = GeomNode(f'{name}_{r}_{c}_{step}')
+                    node.add_geom(self.make_chunk_geom(r, r1, c, c1, step))
+                    lod.add_switch(ranges[i + 1], ranges[i])
+                    chunk.attach_new_node(node)
+
+                self.add_chunk(r // chunk_size, c // chunk_size, chunk, center)
+
+        self.build()
+
+    def get_normals(self):
+        """Return (rows, cols, 3) array of the normals of the vertices.
+        """
+        dz_dy, dz_dx = np.gradient(self.brights)
+        normals = np.stack([-dz_dx, -dz_dy, np.ones_like(dz_dx)], axis=-1)
+        return normals / np.linalg.norm(normals, axis=-1, keepdims=True)
+
+    def make_chunk_geom(self, r0, r1, c0, c1, step):
+        """Return Geom of the cells from (r0, c0) to (r1, c1) with the vertices every step cells,
+           with the skirts hanging from its four edges.
+        """
+        rows, cols = self.brights.shape
+        rs, cs = sample(r0, r1, step), sample(c0, c1, step)
+        rr, cc = np.meshgrid(rs, cs, indexing='ij')
+
+        vertices = np.empty((len(rs), len(cs), 8), dtype=np.float32)
+        vertices[..., 0] = cc
+        vertices[..., 1] = rr
+        vertices[..., 2] = self.brights[rr, cc]
+        vertices[..., 3:6] = self.normals[rr, cc]
+        vertices[..., 6] = cc / (cols - 1)
+        vertices[..., 7] = rr / (rows - 1)
+
+        indices = [grid_indices(len(rs), len(cs))]
+        surface = vertices.reshape(-1, 8)
+        ids = np.arange(len(surface), dtype=np.uint32).reshape(len(rs), len(cs))
+        skirts = []
+        n = len(surface)
+
+        # (the vertices along the edge, True if the skirt faces the other way to the order of the vertices)
+        for edge, flip in ((ids[0], True), (ids[-1], False), (ids[:, 0], False), (ids[:, -1], True)):
+            skirt = surface[edge].copy()
+            skirt[:, 2] -= self.skirt
+            skirts.append(skirt)
+            lower = np.arange(n, n + len(edge), dtype=np.uint32)
+            # the skirts face outward from the chunk.
+            quads = np.stack([edge[:-1], edge[1:], lower[1:], edge[:-1], lower[1:], lower[:-1]], axis=1)
+            indices.append((quads[:, ::-1] if flip else quads).ravel())
+            n += len(edge)
+
+        vertices = np.concatenate([surface, *skirts])
+        return make_geom(vertices, self.get_name(), np.concatenate(indices))
+
+
+def load_terrain_mesh(file_path, cache_dir=os.path.join(ROOT, 'bundle', 'terrain'), **kwargs):
+    """Return the root of the TerrainMesh of the heightfield image, loaded from the cache.
+       The mesh is made and written to the cache if the image or the arguments have changed.
+        Args:
+            file_path (str): the heightfield image.
+            cache_dir (str): the directory of the cached meshes.
+            kwargs: the arguments of TerrainMesh.
+    """
+    with open(file_path, 'rb') as f:
+        key = hashlib.sha256(f.read())
+
+    key.update(repr((TerrainMesh.version, sorted(kwargs.items()))).encode())
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    cache_path = Filename.from_os_specific(os.path.join(cache_dir, f'{name}_{key.hexdigest()[:16]}.bam'))
+
+    if os.path.exists(cache_path.to_os_specific()):
+        if (model := base.loader.load_model(cache_path, noCache=True, okMissing=True)) is not None:
+            return model
+
+    mesh = TerrainMesh(name, read_heightfield(file_path), **kwargs)
+    tmp_path = Filename(f'{cache_path}.tmp')
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+
+        if mesh.write_bam_file(tmp_path):
+            os.replace(tmp_path.to_os_specific(), cache_path.to_os_specific())
+            remove_stale_meshes(cache_dir, name, cache_path.get_basename())
+    except OSError:
+        # the mesh is used without being cached; e.g. the directory is read-only.
+        pass
+
+    return mesh
+
+
+def remove_stale_meshes(cache_dir, name, keep):
+    """Delete the cached meshes of the heightfield image made from its old versions or arguments.
+        Args:
+            cache_dir (str): the directory of the cached meshes.
+            name (str): the name of the heightfield image without the extension.
+            keep (str): the file name of the current mesh.
+    """
+    pattern = re.compile(rf'{re.escape(name)}_[0-9a-f]{{16}}\.bam')
+
+    for file_name in os.listdir(cache_dir):
+        if file_name != keep and pattern.fullmatch(file_name):
+            os.remove(os.path.join(cache_dir, file_name))
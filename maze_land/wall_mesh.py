@@ -0,0 +1,318 @@
+import numpy as np
+from panda3d.core import NodePath, PandaNode, GeomNode, LODNode, BoundingBox, Point3
+from panda3d.core import Geom, GeomTriangles, GeomVertexData, GeomVertexFormat, GeomEnums
+from panda3d.core import Shader, Texture, SamplerState
+
+
+# (row offset of the neighbor, col offset of the neighbor, normal, corners)
+# The corners are in counterclockwise order seen from outside, on a cell
+# whose x and y range from -0.5 to 0.5 and z from 0 to 1.
+FACES = {
+    'north': ((-1, 0), (0, 1, 0), ((0.5, 0.5, 0), (-0.5, 0.5, 0), (-0.5, 0.5, 1), (0.5, 0.5, 1))),
+    'south': ((1, 0), (0, -1, 0), ((-0.5, -0.5, 0), (0.5, -0.5, 0), (0.5, -0.5, 1), (-0.5, -0.5, 1))),
+    'east': ((0, 1), (1, 0, 0), ((0.5, -0.5, 0), (0.5, 0.5, 0), (0.5, 0.5, 1), (0.5, -0.5, 1))),
+    'west': ((0, -1), (-1, 0, 0), ((-0.5, 0.5, 0), (-0.5, -0.5, 0), (-0.5, -0.5, 1), (-0.5, 0.5, 1))),
+    'top': (None, (0, 0, 1), ((-0.5, -0.5, 1), (0.5, -0.5, 1), (0.5, 0.5, 1), (-0.5, 0.5, 1))),
+    'bottom': (None, (0, 0, -1), ((-0.5, 0.5, 0), (0.5, 0.5, 0), (0.5, -0.5, 0), (-0.5, -0.5, 0))),
+}
+
+SIDES = ('north', 'south', 'east', 'west')
+
+UVS = np.array([(0, 0), (1, 0), (1, 1), (0, 1)], dtype=np.float32)
+
+
+def visible_faces(grid, face):
+    """Return a boolean array of the cells whose face is not hidden by a neighbor.
+       Args:
+            grid (numpy.ndarray): boolean array; True for the cells to be drawn.
+            face (str): a key of FACES.
+    """
+    offset = FACES[face][0]
+
+    if offset is None:
+        return grid
+
+    dr, dc = offset
+    padded = np.pad(grid, 1, constant_values=False)
+    rows, cols = grid.shape
+    neighbor = padded[1 + dr:1 + dr + rows, 1 + dc:1 + dc + cols]
+    return grid & ~neighbor
+
+
+def make_vertices(rects, origin, size, bottom, face):
+    """Return vertex rows (x, y, z, nx, ny, nz, u, v) of the faces on the rectangles of cells.
+       The texture coordinates repeat once per cell.
+       Args:
+            rects (numpy.ndarray): (n, 4) array of rectangles (row, col, rows, cols).
+            origin (Point2): the center of the cell (0, 0).
+            size (Vec3): size of a cell.
+            bottom (float): z coordinate of the bottom of the cells.
+            face (str): a key of FACES.
+    """
+    _, normal, corners = FACES[face]
+    r, c, h, w = rects.T.astype(np.float32)
+    corners = np.array(corners, dtype=np.float32)
+
+    vertices = np.empty((len(rects), 4, 8), dtype=np.float32)
+    # the center and the size of the rectangles.
+    x = origin.x + (c + (w - 1) / 2) * size.x
+    y = origin.y - (r + (h - 1) / 2) * size.y
+    vertices[:, :, 0] = x[:, None] + corners[None, :, 0] * (w * size.x)[:, None]
+    vertices[:, :, 1] = y[:, None] + corners[None, :, 1] * (h * size.y)[:, None]
+    vertices[:, :, 2] = bottom + corners[None, :, 2] * size.z
+    vertices[:, :, 3:6] = normal
+
+    match face:
+        case 'north' | 'south':
+            u_len, v_len = w, np.ones_like(w)
+        case 'east' | 'west':
+            u_len, v_len = h, np.ones_like(h)
+        case _:
+            u_len, v_len = w, h
+
+    vertices[:, :, 6] = UVS[None, :, 0] * u_len[:, None]
+    vertices[:, :, 7] = UVS[None, :, 1] * v_len[:, None]
+
+    return vertices.reshape(-1, 8)
+
+
+def merge_faces(visible, face):
+    """Return (n, 4) array of rectangles (row, col, rows, cols) of the merged faces.
+       Side faces are merged into runs along the wall, and top and bottom faces into rectangles.
+    """
+    match face:
+        case 'north' | 'south':
+            rows, cols, lengths = horizontal_runs(visible)
+            return np.stack([rows, cols, np.ones_like(lengths), lengths], axis=1)
+        case 'east' | 'west':
+            cols, rows, lengths = horizontal_runs(visible.T)
+            return np.stack([rows, cols, lengths, np.ones_like(lengths)], axis=1)
+        case _:
+            return merge_rectangles(visible)
+
+
+def make_geom(vertices, name, indices=None):
+    """Return Geom made of quads, every 4 rows of the vertices being one quad,
+       or of the triangles of the indices if given.
+    """
+    n = len(vertices)
+    vdata = GeomVertexData(name, GeomVertexFormat.get_v3n3t2(), Geom.UH_static)
+    vdata.unclean_set_num_rows(n)
+    memoryview(vdata.modify_array(0)).cast('B').cast('f')[:] = vertices.ravel()
+
+    if indices is None:
+        quads = np.arange(0, n, 4, dtype=np.uint32)[:, None]
+        indices = (quads + np.array([0, 1, 2, 0, 2, 3], dtype=np.uint32)).ravel()
+
+    prim = GeomTriangles(Geom.UH_static)
+    prim.set_index_type(GeomEnums.NT_uint32)
+    prim.modify_vertices().unclean_set_num_rows(len(indices))
+    memoryview(prim.modify_vertices()).cast('B').cast('I')[:] = indices
+
+    geom = Geom(vdata)
+    geom.add_primitive(prim)
+    return geom
+
+
+class ChunkTree(NodePath):
+    """Chunks of a maze grouped into a quadtree, so that the cull traversal tests
+       the bounds of a group of chunks once and skips all of them if it is out of view.
+       Args:
+            name (str)
+            radius (float): the distance from the camera to the center of a chunk
+                            beyond which the chunk is not drawn; None to draw all chunks.
+    """
+
+    def __init__(self, name, radius=None):
+        super().__init__(PandaNode(name))
+        self.radius = radius
+        self.chunks = {}   # (row, col) of the chunk: NodePath
+
+    def add_chunk(self, row, col, chunk_np, center):
+        """Add a node to the chunk (row, col), wrapping it in a LODNode if radius is given,
+           and return the node.
+           Args:
+                row (int): the row of the chunk; not of the cell.
+                col (int): the column of the chunk; not of the cell.
+                chunk_np (NodePath): the node of the chunk.
+                center (Point3): the center of the chunk, from which the radius is measured.
+        """
+        self.chunks[(row, col)] = chunk_np
+
+        if self.radius is not None:
+            lod = NodePath(LODNode(f'lod_{chunk_np.get_name()}'))
+            lod.node().add_switch(self.radius, 0)
+            lod.node().set_center(center)
+            chunk_np.reparent_to(lod)
+            self.chunks[(row, col)] = lod
+
+        return chunk_np
+
+    def build(self):
+        """Group the chunks into a quadtree under this node.
+        """
+        level = self.chunks
+
+        while len(level) > 1:
+            parents = {}
+
+            for (r, c), chunk_np in level.items():
+                if (key := (r // 2, c // 2)) not in parents:
+                    parents[key] = NodePath(PandaNode(f'{self.get_name()}_{len(level)}_{key[0]}_{key[1]}'))
+                chunk_np.reparent_to(parents[key])
+
+            level = parents
+
+        for chunk_np in level.values():
+            chunk_np.reparent_to(self)
+
+
+class WallMesh(ChunkTree):
+    """Batched geometry of the wall cells; one GeomNode per chunk of cells.
+       The faces hidden by a neighboring cell are not created,
+       and the faces next to each other on the same plane are merged into one quad.
+       Args:
+            name (str)
+            grid (numpy.ndarray): True or 1 for the cells to be drawn.
+            size (Vec3): size of a cell.
+            origin (Point2): the center of the cell (0, 0).
+            bottom (float): z coordinate of the bottom of the cells.
+            faces (tuple of str): keys of FACES to be drawn.
+            chunk_size (int): the number of rows and columns of a chunk.
+            radius (float): see ChunkTree.
+    """
+
+    def __init__(self, name, grid, size, origin, bottom, faces, chunk_size=16, radius=None):
+        super().__init__(name, radius)
+        self.chunk_size = chunk_size
+        grid = np.asarray(grid).astype(bool)
+        rows, cols = grid.shape
+
+        # face: (rows, cols) array of visible faces
+        visibles = {face: visible_faces(grid, face) for face in faces}
+
+        for r in range(0, rows, chunk_size):
+            for c in range(0, cols, chunk_size):
+                area = (slice(r, r + chunk_size), slice(c, c + chunk_size))
+                chunks = []
+
+                for face, visible in visibles.items():
+                    rects = merge_faces(visible[area], face) + [r, c, 0, 0]
+                    chunks.append(make_vertices(rects, origin, size, bottom, face))
+
+                if len(vertices := np.concatenate(chunks)):
+                    node = GeomNode(f'{name}_{r}_{c}')
+                    node.add_geom(make_geom(vertices, name))
+                    center = Point3(*(vertices[:, :3].min(axis=0) + vertices[:, :3].max(axis=0)) / 2)
+                    self.add_chunk(r // chunk_size, c // chunk_size, NodePath(node), center)
+
+        self.build()
+
+    def get_geom_nodes(self):
+        return [np.node() for np in self.find_all_matches('**/+GeomNode')]
+
+
+def supports_instancing():
+    """Return True if the window can draw instanced geometry with the GLSL shaders.
+    """
+    if (win := getattr(base, 'win', None)) is None or (gsg := win.get_gsg()) is None:
+        return False
+
+    return gsg.get_supports_basic_shaders() and gsg.get_supports_geometry_instancing()
+
+
+class WallInstances(NodePath):
+    """Geometry of one wall cell drawn once for each wall cell by hardware instancing.
+       The offsets of the cells are passed to the shader as a float texture,
+       so that all the cells are drawn in one draw call whatever the size of the maze.
+       Unlike WallMesh, the faces hidden by a neighboring cell are drawn.
+       Args:
+            name (str)
+            grid (numpy.ndarray): True or 1 for the cells to be drawn.
+            size (Vec3): size of a cell.
+            origin (Point2): the center of the cell (0, 0).
+            bottom (float): z coordinate of the bottom of the cells.
+            faces (tuple of str): keys of FACES to be drawn.
+            width (int): the width of the offset texture.
+    """
+
+    def __init__(self, name, grid, size, origin, bottom, faces, width=1024):
+        super().__init__(GeomNode(name))
+        rows, cols = np.nonzero(np.asarray(grid).astype(bool))
+        cell = np.zeros((1, 4), dtype=np.int64)
+        vertices = np.concatenate([make_vertices(cell + [0, 0, 1, 1], origin, size, bottom, face) for face in faces])
+        self.node().add_geom(make_geom(vertices, name))
+
+        offsets = np.zeros((max(-(-len(rows) // width), 1) * width, 4), dtype=np.float32)
+        offsets[:len(rows), 0] = cols * size.x
+        offsets[:len(rows), 1] = -rows * size.y
+
+        tex = Texture(f'{name}_offsets')
+        tex.setup_2d_texture(width, len(offsets) // width, Texture.T_float, Texture.F_rgba32)
+        tex.set_minfilter(SamplerState.FT_nearest)
+        tex.set_magfilter(SamplerState.FT_nearest)
+        tex.set_ram_image(offsets.tobytes())
+
+        self.set_shader(Shader.load(Shader.SL_GLSL, 'shaders/instance_v.glsl', 'shaders/instance_f.glsl'))
+        self.set_shader_input('offsets', tex)
+        self.set_instance_count(len(rows))
+
+        # the bounds of the geom cover only the cell (0, 0).
+        x0, y0 = origin.x - size.x / 2, origin.y + size.y / 2
+        x1, y1 = x0 + (cols.max(initial=0) + 1) * size.x, y0 - (rows.max(initial=0) + 1) * size.y
+        self.node().set_bounds(BoundingBox(Point3(x0, y1, bottom), Point3(x1, y0, bottom + size.z)))
+        self.node().set_final(True)
+
+
+def horizontal_runs(grid):
+    """Return rows, first columns and lengths of the horizontal runs of True cells.
+    """
+    padded = np.pad(np.asarray(grid, dtype=np.int8), ((0, 0), (1, 1)))
+    diff = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(diff == 1)
+    _, ends = np.nonzero(diff == -1)
+    return rows, starts, ends - starts
+
+
+def run_lengths(grid):
+    """Return the length of the horizontal run that each cell belongs to; 0 for False cells.
+    """
+    rows, cols, lengths = horizontal_runs(grid)
+    firsts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    offsets = np.arange(lengths.sum()) - firsts
+
+    runs = np.zeros(np.shape(grid), dtype=np.int64)
+    runs[np.repeat(rows, lengths), np.repeat(cols, lengths) + offsets] = np.repeat(lengths, lengths)
+    return runs
+
+
+def stack_runs(rows, cols, lengths):
+    """Return (n, 4) array of rectangles (row, col, rows, cols),
+       merging the runs that have the same columns in consecutive rows.
+    """
+    rects = []
+    stacks = {}   # (col, length): index of the rectangle
+
+    for r, c, w in zip(rows, cols, lengths):
+        if (i := stacks.get((c, w))) is not None and rects[i][0] + rects[i][2] == r:
+            rects[i][2] += 1
+        else:
+            stacks[(c, w)] = len(rects)
+            rects.append([r, c, 1, w])
+
+    return np.array(rects, dtype=np.int64).reshape(-1, 4)
+
+
+def merge_rectangles(grid):
+    """Return (n, 4) array of rectangles (row, col, rows, cols) which partition the True cells.
+       Each cell is merged along the longer of its horizontal and vertical runs,
+       and then the runs of the same span in consecutive rows or columns are merged.
+    """
+    grid = np.asarray(grid).astype(bool)
+    horizontal = grid & (run_lengths(grid) >= run_lengths(grid.T).T)
+    vertical = grid & ~horizontal
+
+    h_rects = stack_runs(*horizontal_runs(horizontal))
+    v_rects = stack_runs(*horizontal_runs(vertical.T))
+
+    return np.concatenate([h_rects, v_rects[:, [1, 0, 3, 2]]])
@@ -0,0 +1,32 @@
+#version 300 es
+precision highp float;
+
+uniform sampler2D p3d_Texture0;
+
+uniform struct {
+    vec4 ambient;
+} p3d_LightModel;
+
+uniform struct {
+    vec4 color;
+    vec4 position;
+} p3d_LightSource[2];
+
+in vec2 texcoord;
+in vec3 normal;
+in vec3 position;
+
+out vec4 fragColor;
+
+void main() {
+    vec4 color = texture(p3d_Texture0, texcoord);
+    vec3 light = p3d_LightModel.ambient.rgb;
+
+    for (int i = 0; i < p3d_LightSource.length(); ++i) {
+        // w is 0 for directional lights.
+        vec3 direction = p3d_LightSource[i].position.xyz - position * p3d_LightSource[i].position.w;
+        light += p3d_LightSource[i].color.rgb * max(dot(normalize(normal), normalize(direction)), 0.0);
+    }
+
+    fragColor = vec4(color.rgb * light, color.a);
+}
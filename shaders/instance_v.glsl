@@ -0,0 +1,28 @@
+#version 300 es
+precision highp float;
+uniform mat4 p3d_ModelViewProjectionMatrix;
+uniform mat4 p3d_ModelViewMatrix;
+uniform mat3 p3d_NormalMatrix;
+uniform mat4 p3d_TextureMatrix;
+
+// xyz: the offset of each instance
+uniform sampler2D offsets;
+
+in vec4 p3d_Vertex;
+in vec3 p3d_Normal;
+in vec2 p3d_MultiTexCoord0;
+
+out vec2 texcoord;
+out vec3 normal;
+out vec3 position;
+
+void main() {
+    int width = textureSize(offsets, 0).x;
+    vec4 offset = texelFetch(offsets, ivec2(gl_InstanceID % width, gl_InstanceID / width), 0);
+    vec4 vertex = vec4(p3d_Vertex.xyz + offset.xyz, 1.0);
+
+    gl_Position = p3d_ModelViewProjectionMatrix * vertex;
+    position = vec3(p3d_ModelViewMatrix * vertex);
+    normal = normalize(p3d_NormalMatrix * p3d_Normal);
+    texcoord = (p3d_TextureMatrix * vec4(p3d_MultiTexCoord0, 0.0, 1.0)).xy;
+}
@@ -0,0 +1,67 @@
+"""Run rounds of MazeLand without a window, and print the results.
+   python simulate.py --rounds 100
+   python simulate.py --rounds 100 --record session.mzr
+   python simulate.py --replay session.mzr
+"""
+import argparse
+import time
+
+from maze_land.simulation import HeadlessMazeLand, ExitSeeker
+from maze_land.replay import Replay
+from maze_land.profiler import profiler
+from maze_algorithm.cache import MazeCache
+
+
+def print_result(i, result):
+    print(f"round {i + 1:>4}: {'escaped' if result.escaped else 'lost':>7} "
+          f"{result.frames:>6} frames {result.sim_time:>8.2f} s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--dt', type=float, default=1 / 60, help='the fixed time step in seconds.')
+    parser.add_argument('--max-frames', type=int, default=None, help='give up a round after the frames.')
+    parser.add_argument('--error-rate', type=float, default=0, help='the probability of a random input.')
+    parser.add_argument('--seed', type=int, default=None, help='seed for the mazes, the aircrafts and the inputs.')
+    parser.add_argument('--record', default=None, help='save the session to the file.')
+    parser.add_argument('--replay', default=None, help='play back the session saved in the file.')
+    parser.add_argument('--levels', default=None, help='choose the mazes from the maze cache file.')
+    parser.add_argument('--profile', default=None, help='save the timings of the last frames as a Chrome trace.')
+    parser.add_argument('--profile-frames', type=int, default=3600, help='the number of frames to be profiled.')
+    args = parser.parse_args()
+
+    if args.profile:
+        profiler.allocate(args.profile_frames)
+        profiler.enable()
+
+    levels = MazeCache(args.levels) if args.levels else None
+    start = time.perf_counter()
+
+    if args.replay:
+        replay = Replay.load(args.replay)
+        app = HeadlessMazeLand(replay=replay, max_frames=args.max_frames, levels=levels)
+
+        for i, result in enumerate(app.play()):
+            print_result(i, result)
+
+        elapsed = time.perf_counter() - start
+        print(f'{len(replay)} frames of seed {replay.seed} played back, {elapsed:.2f} s')
+
+    else:
+        script = ExitSeeker(args.error_rate, args.seed)
+        app = HeadlessMazeLand(
+            script, args.dt, args.max_frames, args.seed, record_path=args.record, levels=levels)
+
+        for i in range(args.rounds):
+            print_result(i, app.simulate()[0])
+
+        elapsed = time.perf_counter() - start
+        escapes = sum(result.escaped for result in app.results)
+        print(f'{escapes}/{args.rounds} escaped, {elapsed:.2f} s, {args.rounds / elapsed * 3600:.0f} rounds/hour')
+
+    if args.profile:
+        profiler.dump(args.profile)
+
+        for name, (mean, peak) in profiler.get_stats(args.profile_frames).items():
+            print(f'{name:<10} mean {mean:7.3f} ms  max {peak:7.3f} ms')